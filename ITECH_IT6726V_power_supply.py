@@ -1,18 +1,29 @@
-import pyvisa
 import time
 import threading
-import usb
 import configparser
+import logging
 from data_buffer import DataBuffer
-from tkinter import messagebox
-from instrument import Instrument
+from telemetry import TelemetryStore
+from telemetry_recorder import TelemetryRecorder
+from decimation import MinMaxPyramid
+from instrument import Instrument, visa_io_error, transport_errors, is_link_loss, reconnecting, exclusive
+from hupulser_config import CONFIG_PATH
+from command_queue import InstrumentCommandQueue
+from loop_scheduler import DeadlineScheduler
+from loop_profiler import LoopProfiler
 import os
 
+logger = logging.getLogger(__name__)
+
 
 # DC power supply ITECH_IT6726V
+# every supply is configured by its own ini section (DC1, DC2, ...)
+# with shared_telemetry the telemetry store is created in shared memory (control loop in a separate process)
+# config is the parsed ini file of the application; without it the ini file is read by the driver
 class ItechIT6726VPowerSupply(Instrument):
-    def __init__(self):
+    def __init__(self, section='DC1', shared_telemetry=False, config=None):
         super().__init__()
+        self._section = section
         self._mode = 1  # first mode after start is Power mode
         self._setpoints = [0.0, 0.0, 0.0]  # (U, P, I)
         self._setpoint_max = (3000, 1200, 5000)  # max U, P, I according to power supply
@@ -21,58 +32,93 @@ class ItechIT6726VPowerSupply(Instrument):
         # self._inst = None   # representation of the PS for read/write commands
         self._status = {'outputON': False}
         self._thread = None
-        self._config = configparser.ConfigParser()
-        # self._config.read('hupulser.ini') # Linux version
-        config_path = os.path.join(os.path.dirname(__file__), 'hupulser.ini')
-        self._config.read(config_path, encoding='utf-8')    # read file with initial settings
+        if config is None:
+            config = configparser.ConfigParser()
+            config.read(CONFIG_PATH, encoding='utf-8')    # read file with initial settings
+        self._config = config
         try:
             # number of values in the buffer; used for storing the data and for plotting
-            self._buffer_no_elements = int(self._config['DC1']['buffer_size'])
+            self._buffer_no_elements = int(self._config[self._section]['buffer_size'])
         except KeyError:
-            messagebox.showinfo('Info', 'Size of buffer not found in ini file. Taking standard value of 10 values.')
+            logger.warning('%s: size of buffer not found in ini file, taking standard value of 10 values',
+                           self._section)
             self._buffer_no_elements = 10
         try:
             # number of last values used for a filter (average value) to determine mode
-            self._mode_determination_no_of_values = int(self._config['DC1']['mode_determination_no_of_values'])
+            self._mode_determination_no_of_values = int(self._config[self._section]['mode_determination_no_of_values'])
         except KeyError:
-            messagebox.showinfo('Info', 'Number of last values for averaging for mode determination not found in ini '
-                                        'file. Taking standard value of 5.')
+            logger.warning('%s: number of last values for averaging for mode determination not found in ini file, '
+                           'taking standard value of 5', self._section)
             self._mode_determination_no_of_values = 5
-        # initialization of individual buffers
-        self._buffer_time = DataBuffer(self._buffer_no_elements)
-        self._buffer_voltage_calc = DataBuffer(self._buffer_no_elements)
-        self._buffer_voltage_ps = DataBuffer(self._buffer_no_elements)
-        self._buffer_power_ps = DataBuffer(self._buffer_no_elements)
-        self._buffer_current_ps = DataBuffer(self._buffer_no_elements)
+        try:
+            # non-controlled quantities are read only every n-th cycle of the PID loop
+            self._slow_sampling_cycles = max(1, int(self._config[self._section]['slow_sampling_cycles']))
+            # all quantities are read every cycle when one of them exceeds this fraction of its limit
+            self._near_limit_ratio = float(self._config[self._section]['near_limit_ratio'])
+        except KeyError:
+            logger.warning('%s: slow sampling cycles or near limit ratio not found in ini file, taking standard '
+                           'values of 3 and 0.9', self._section)
+            self._slow_sampling_cycles = 3
+            self._near_limit_ratio = 0.9
+        # initialization of the telemetry store (time, calculated voltage, U, P, I and mode of every cycle)
+        self._telemetry = TelemetryStore(self._buffer_no_elements, create=shared_telemetry)
+        # decimated history of the whole run for the plot (calculated voltage, U, P, I)
+        self._history = MinMaxPyramid(4)
+        try:
+            # complete history of every run is recorded to this directory
+            self._recorder = TelemetryRecorder(os.path.join(os.path.dirname(__file__),
+                                                            self._config[self._section]['record_directory']))
+        except KeyError:    # recording is optional, disabled when no directory is configured
+            self._recorder = None
+        # buffers with really measured samples of U, P, I used for the mode determination (slow sampling aware)
+        self._mode_samples = [DataBuffer(self._mode_determination_no_of_values) for _ in range(3)]
         # initialization of PID values for voltage, power and current mode
         self._pid_values_voltage = [0.0, 0.0, 0.0]  # (P, I, D)
         self._pid_values_power = [0.0, 0.0, 0.0]  # (P, I, D)
         self._pid_values_current = [0.0, 0.0, 0.0]  # (P, I, D)
-        # initialization of the sleep time in the main pid loop
-        self._pid_sleep_time = 0
+        # initialization of the scheduler of the main pid loop (fixed loop frequency in Hz)
+        self._scheduler = DeadlineScheduler(10)
+        # timing of the phases of the pid loop (USB queries, computation, VOLT write, buffer updates, sleep)
+        self._profiler = LoopProfiler(('read', 'compute', 'write', 'buffers', 'sleep'), idle_phase='sleep')
+        # profiling is optional, disabled when not configured
+        self._profiler.enabled = self._config.getboolean(self._section, 'loop_profiling', fallback=False)
+        # combined U/P/I query is tried first, falls back to individual queries if rejected by the firmware
+        self._combined_query_enabled = True
+        self._read_round_trip_time = 0.0    # duration of the last readback of U, P, I in seconds
+        self._voltage = 0.0     # last voltage sent by the PID loop, sent again after a reconnect
         # initialization of the max and min voltage values used in the PID loop
         self._over_voltage_protection = 0
         self._under_voltage_protection = 0
         try:
             # load the saved values from the ini file
-            self.set_pid_values(0, 0, self._config['DC1']['p_voltage'])
-            self.set_pid_values(0, 1, self._config['DC1']['i_voltage'])
-            self.set_pid_values(0, 2, self._config['DC1']['d_voltage'])
-            self.set_pid_values(1, 0, self._config['DC1']['p_power'])
-            self.set_pid_values(1, 1, self._config['DC1']['i_power'])
-            self.set_pid_values(1, 2, self._config['DC1']['d_power'])
-            self.set_pid_values(2, 0, self._config['DC1']['p_current'])
-            self.set_pid_values(2, 1, self._config['DC1']['i_current'])
-            self.set_pid_values(2, 2, self._config['DC1']['d_current'])
-            self._pid_sleep_time = float(self._config['DC1']['pid_sleep_time'])
+            self.set_pid_values(0, 0, self._config[self._section]['p_voltage'])
+            self.set_pid_values(0, 1, self._config[self._section]['i_voltage'])
+            self.set_pid_values(0, 2, self._config[self._section]['d_voltage'])
+            self.set_pid_values(1, 0, self._config[self._section]['p_power'])
+            self.set_pid_values(1, 1, self._config[self._section]['i_power'])
+            self.set_pid_values(1, 2, self._config[self._section]['d_power'])
+            self.set_pid_values(2, 0, self._config[self._section]['p_current'])
+            self.set_pid_values(2, 1, self._config[self._section]['i_current'])
+            self.set_pid_values(2, 2, self._config[self._section]['d_current'])
         except KeyError:  # key Pulser not found in config (no config present)
-            messagebox.showinfo('Info', 'PID values were not found in ini file.')
+            logger.warning('%s: PID values were not found in ini file', self._section)
         try:
-            self._pid_sleep_time = float(self._config['DC1']['pid_sleep_time'])
-            self._over_voltage_protection = float(self._config['DC1']['over_voltage_protection'])
-            self._under_voltage_protection = float(self._config['DC1']['under_voltage_protection'])
+            self._over_voltage_protection = float(self._config[self._section]['over_voltage_protection'])
+            self._under_voltage_protection = float(self._config[self._section]['under_voltage_protection'])
         except KeyError:  # key Pulser not found in config (no config present)
-            messagebox.showinfo('Info', 'PID sleep time, OVP or UVP value were not found in ini file.')
+            logger.warning('%s: OVP or UVP value were not found in ini file', self._section)
+        try:
+            self._scheduler.frequency = self._config[self._section]['pid_loop_frequency']
+        except KeyError:
+            try:    # ini files of older versions have the sleep time of the loop instead of its frequency
+                self._scheduler.frequency = 1 / float(self._config[self._section]['pid_sleep_time'])
+            except (KeyError, ValueError, ZeroDivisionError):
+                logger.warning('%s: PID loop frequency was not found in ini file, taking standard value of %g Hz',
+                               self._section, self._scheduler.frequency)
+
+    @property
+    def section(self):
+        return self._section
 
     @property
     def mode(self):
@@ -114,9 +160,15 @@ class ItechIT6726VPowerSupply(Instrument):
         return self._status['outputON']
 
     @output.setter
+    @exclusive
+    @reconnecting
     def output(self, value):
         if self._connected:
             if value:  # switch power supply ON
+                if self._status['outputON']:    # already on, only one PID loop may control the PS
+                    return
+                if self._thread is not None:
+                    self._thread.join()     # the loop of the last run may still be in its last cycle
                 self._inst.write(":OUTPut ON")  # output voltage ON
                 self._status['outputON'] = True
                 # get the actual PID values
@@ -130,11 +182,13 @@ class ItechIT6726VPowerSupply(Instrument):
                 i_current = self.get_pid_values(2)[1]
                 d_current = self.get_pid_values(2)[2]
                 # start new thread with PID regulation!!!
-                threading.Thread(target=self.pid_control, args=(p_voltage, i_voltage, d_voltage, p_power, i_power,
-                                                                d_power, p_current, i_current, d_current)).start()
+                self._thread = threading.Thread(target=self.pid_control, args=(p_voltage, i_voltage, d_voltage,
+                                                                               p_power, i_power, d_power, p_current,
+                                                                               i_current, d_current))
+                self._thread.start()
             else:  # output voltage OFF
-                self._inst.write(":OUTPut OFF")
-                self._status['outputON'] = False  # change the status (output ON/OFF)
+                self._status['outputON'] = False  # change the status (output ON/OFF), also restored after reconnect
+                self._inst.write(":OUTPut OFF", priority=InstrumentCommandQueue.SAFETY)  # ahead of queued queries
 
 
     @property
@@ -149,29 +203,57 @@ class ItechIT6726VPowerSupply(Instrument):
     def status(self):
         return self._status
 
+    @property
+    def read_round_trip_time(self):
+        return self._read_round_trip_time
+
+    @property
+    def combined_query_enabled(self):
+        return self._combined_query_enabled
+
+    @property
+    def scheduler(self):
+        return self._scheduler
+
+    @property
+    def profiler(self):
+        return self._profiler
+
+    @property
+    def telemetry(self):
+        return self._telemetry
+
+    @property
+    def history(self):
+        return self._history
+
+    @property
+    def recorder(self):
+        return self._recorder
+
     @property
     def buffer_time(self):
-        return self._buffer_time.buffer
+        return self._telemetry.snapshot()[:, TelemetryStore.TIME]
 
     @property
     def buffer_voltage(self):
-        return self._buffer_voltage_calc.buffer
+        return self._telemetry.snapshot()[:, TelemetryStore.VOLTAGE_CALC]
 
     @property
     def buffer_voltage_ps(self):
-        return self._buffer_voltage_ps.buffer
+        return self._telemetry.snapshot()[:, TelemetryStore.VOLTAGE_PS]
 
     @property
     def buffer_power(self):
-        return self._buffer_power_ps.buffer
+        return self._telemetry.snapshot()[:, TelemetryStore.POWER_PS]
 
     @property
     def buffer_current(self):
-        return self._buffer_current_ps.buffer
+        return self._telemetry.snapshot()[:, TelemetryStore.CURRENT_PS]
 
     @property
     def buffer_power_ps(self):
-        return self._buffer_power_ps.buffer
+        return self._telemetry.snapshot()[:, TelemetryStore.POWER_PS]
 
     def get_pid_values(self, mode):
         # return PID values for the current mode
@@ -214,8 +296,10 @@ class ItechIT6726VPowerSupply(Instrument):
         avg_buffer_power_ps = 0
         avg_buffer_current_ps = 0
 
-        time_start = time.time()  # get the actual epoch time in seconds
-        time_prev = time.time() - time_start    # calculate the initial time
+        # new run; cleared by the loop itself, the buffers and the telemetry store have a single writer
+        self.clear_buffers()
+        self._scheduler.start()     # start the fixed-rate loop timing
+        time_prev = self._scheduler.elapsed()    # calculate the initial time
         # take the initial error of the controlled value (SETPOINT - 0 = SETPOINT) based on the selected mode
         if self.mode == 0:
             e_prev = self.setpoints[self.mode]
@@ -225,39 +309,76 @@ class ItechIT6726VPowerSupply(Instrument):
             e_prev = self.setpoints[self.mode]
         mode_prev = self.mode   # keep the initial mode value
         # time.sleep(0.05)
+        values_ps = [0.0, 0.0, 0.0]     # last known (U, P, I) of the PS
+        if self._recorder is not None:
+            self._recorder.start(self._section.lower())     # new recording for every run
+        cycle = 0   # number of the PID cycle, used for the slow sampling of non-controlled quantities
+        held = False    # True after cycles without valid values (lost link or failed read)
+        self._profiler.reset()
 
         while self._status['outputON']:     # until output is not turned off
-            voltage_ps, power_ps, current_ps = self.read_actual_value_for_pid()
+            self._profiler.begin_cycle()
+            # after a lost link: one attempt to reconnect if due, the configuration incl. the last voltage is restored
+            values_read = None
+            if self._link_up or self.reconnect():
+                if self.full_sampling_needed(cycle, values_ps):
+                    values_read = self.read_actual_value_for_pid()  # read all quantities
+                    modes_read = range(3)
+                else:   # read only the controlled quantity, keep the last known values of the others
+                    value = self.read_actual_value_for_mode(self.mode)
+                    if value is not None:
+                        values_read = list(values_ps)
+                        values_read[self.mode] = value
+                    modes_read = (self.mode,)
+            if values_read is None:     # no valid values, the last voltage is held (nothing is sent)
+                self._scheduler.wait()
+                time_prev = self._scheduler.elapsed()   # the outage is not integrated by the PID
+                held = True
+                continue
+            values_ps = list(values_read)
+            if held:    # the error from before the outage would give a derivative kick
+                e_prev = self.setpoints[self.mode] - values_ps[self.mode]
+                held = False
+            for mode in modes_read:
+                self._mode_samples[mode].update(values_ps[mode])
+            voltage_ps, power_ps, current_ps = values_ps
+            self._profiler.mark('read')
+            time_act = self._scheduler.elapsed()    # time of the actual sample
+            cycle += 1
             self._mode = self.mode_determination(avg_buffer_voltage_ps, avg_buffer_power_ps, avg_buffer_current_ps, mode_prev)
             if not mode_prev == self.mode:  # if the mode was changed
                 e_sum = u_prev
             if self.mode == 0:  # voltage mode
                 actual_value = voltage_ps
-                time_prev, e_prev, e_sum, u_prev = self.pid_control_one_cycle(time_start, time_prev, e_prev,
+                time_prev, e_prev, e_sum, u_prev = self.pid_control_one_cycle(time_act, time_prev, e_prev,
                                                                                 e_sum, p_voltage, i_voltage,
                                                                                 d_voltage, actual_value,
                                                                                 self.setpoints[self.mode])
             if self.mode == 1:  # power mode
                 actual_value = power_ps
-                time_prev, e_prev, e_sum, u_prev = self.pid_control_one_cycle(time_start, time_prev, e_prev,
+                time_prev, e_prev, e_sum, u_prev = self.pid_control_one_cycle(time_act, time_prev, e_prev,
                                                                         e_sum, p_power, i_power, d_power, actual_value,
                                                                         self.setpoints[self.mode])
             if self.mode == 2:  # current mode
                 actual_value = current_ps
-                time_prev, e_prev, e_sum, u_prev = self.pid_control_one_cycle(time_start, time_prev, e_prev,
+                time_prev, e_prev, e_sum, u_prev = self.pid_control_one_cycle(time_act, time_prev, e_prev,
                                                                         e_sum, p_current, i_current, d_current,
                                                                         actual_value, self.setpoints[self.mode])
 
-            self.add_values_to_buffers(time_prev, u_prev, voltage_ps, power_ps, current_ps)
+            self.add_values_to_buffers(time_prev, u_prev, voltage_ps, power_ps, current_ps, self.mode)
             avg_buffer_voltage_ps, avg_buffer_power_ps, avg_buffer_current_ps = \
                             self.calculate_average_values_for_mode_determination(self._mode_determination_no_of_values)
             mode_prev = self.mode   # keep the actual mode for the next run
-            time.sleep(self._pid_sleep_time)    # allow the PS voltage to react on the request
-
-    def pid_control_one_cycle(self, time_start, time_prev, e_prev, e_sum, p, i, d, actual_value, desired_value):
+            self._profiler.mark('buffers')
+            self._scheduler.wait()    # wait for the next period, allow the PS voltage to react on the request
+            self._profiler.mark('sleep')
+            self._profiler.end_cycle(self._scheduler.period)
+        if self._recorder is not None:
+            self._recorder.stop()   # write the rest of the recording
+
+    def pid_control_one_cycle(self, time_act, time_prev, e_prev, e_sum, p, i, d, actual_value, desired_value):
         e = desired_value - actual_value  # calculate the actual error of the power (P element)
-        time_act = time.time() - time_start  # get the actual time in seconds
-        dt = time_act - time_prev  # calculate the time duration of the cycle
+        dt = time_act - time_prev  # calculate the real time duration of the cycle (time_act is the sample time)
         e_sum = e_sum + e * dt  # calculate the integral of the power error (I element)
         dedt = (e - e_prev) / dt  # calculate time derivation of the power error (D element)
         time_prev = time_act  # keep the actual time for the next cycle
@@ -268,41 +389,115 @@ class ItechIT6726VPowerSupply(Instrument):
             u = self._under_voltage_protection
         if u > self._over_voltage_protection:
             u = self._over_voltage_protection
-        self._inst.write("VOLT " + str(u))  # send the new voltage value to the PS
+        self._profiler.mark('compute')
+        self._voltage = u
+        try:
+            self._inst.write("VOLT " + str(u))  # send the new voltage value to the PS
+        except transport_errors() as exc:   # sent again with the restored configuration
+            self.link_lost(exc)
+        self._profiler.mark('write')
         u_prev = u  # keep the actual voltage
         return time_prev, e_prev, e_sum, u_prev
 
     def read_actual_value_for_pid(self):
-        # read actual values from the PS
+        # read actual values from the PS, None if they could not be read (lost link, timeout)
         value_voltage_ps = 0
         value_power_ps = 0
         value_current_ps = 0
+        time_start = time.perf_counter()
         try:
-            value_voltage_ps = float(self._inst.query("MEASure:VOLTage?"))  # get the actual voltage of the PS
-            value_power_ps = float(self._inst.query("MEASure:POWEr?"))  # get the actual power of the PS
-            value_current_ps = float(self._inst.query("MEASure:CURRent?")) * 1000 # get the actual current of the PS in mA
-        except usb.core.USBError as exc:
-            print("Communication issue - error : {}".format(exc.strerror))
+            combined_read = False
+            if self._combined_query_enabled:
+                try:
+                    value_voltage_ps, value_power_ps, value_current_ps = self.read_actual_value_combined()
+                    combined_read = True
+                except (visa_io_error(), ValueError) as exc:
+                    if isinstance(exc, visa_io_error()) and is_link_loss(exc):
+                        raise
+                    self.check_combined_query_rejected(exc)
+            if not combined_read:   # individual queries, also in the cycle of a failed combined query
+                value_voltage_ps = float(self._inst.query("MEASure:VOLTage?"))  # get the actual voltage of the PS
+                value_power_ps = float(self._inst.query("MEASure:POWEr?"))  # get the actual power of the PS
+                value_current_ps = float(self._inst.query("MEASure:CURRent?")) * 1000 # get the actual current of the PS in mA
+        except transport_errors() as exc:
+            self.link_lost(exc)     # no values, the loop holds the last voltage
+            return None
+        finally:
+            self._read_round_trip_time = time.perf_counter() - time_start
         return value_voltage_ps, value_power_ps, value_current_ps
 
-    def add_values_to_buffers(self, process_time, voltage_calc, voltage_ps, power_ps, current_ps):
-        self._buffer_time.update(process_time)
-        self._buffer_voltage_calc.update(voltage_calc)
-        self._buffer_voltage_ps.update(voltage_ps)
-        self._buffer_power_ps.update(power_ps)
-        self._buffer_current_ps.update(current_ps)
+    def read_actual_value_for_mode(self, mode):
+        # read only the quantity controlled in the given mode (0 = U, 1 = P, 2 = I in mA), None if it could not be read
+        value = 0
+        time_start = time.perf_counter()
+        try:
+            if mode == 0:
+                value = float(self._inst.query("MEASure:VOLTage?"))
+            elif mode == 1:
+                value = float(self._inst.query("MEASure:POWEr?"))
+            elif mode == 2:
+                value = float(self._inst.query("MEASure:CURRent?")) * 1000
+        except transport_errors() as exc:
+            self.link_lost(exc)     # no value, the loop holds the last voltage
+            return None
+        finally:
+            self._read_round_trip_time = time.perf_counter() - time_start
+        return value
+
+    def full_sampling_needed(self, cycle, values_ps):
+        # with the combined query all quantities cost one round trip, the slow cadence would save nothing
+        if self._combined_query_enabled:
+            return True
+        # all quantities are read on the slow cadence ...
+        if cycle % self._slow_sampling_cycles == 0:
+            return True
+        # ... or immediately when a non-controlled quantity comes near its limit (mode change is likely)
+        for mode in range(3):
+            if mode != self.mode and values_ps[mode] >= self._near_limit_ratio * self.setpoints[mode]:
+                return True
+        return False
+
+    # a compound query rejected by the firmware is reported in its error queue; the combined query is disabled only
+    # then, a timeout or a garbled answer alone keeps it
+    def check_combined_query_rejected(self, exc):
+        error = self._inst.query(":SYSTem:ERRor?").strip()
+        code = error.split(',', 1)[0]
+        if ',' in error and code.lstrip('+-').isdigit() and int(code) != 0:
+            self._combined_query_enabled = False
+            self._inst.write("*CLS")     # clean the error queue after the rejected command
+            logger.warning('%s: combined measurement query rejected (%s), using individual queries', self._section,
+                           error)
+        else:
+            logger.warning('%s: combined measurement query failed (%s)', self._section, exc)
+
+    def read_actual_value_combined(self):
+        # measure U, P, I in one transaction using the compound query; answer is "U;P;I"
+        answer = self._inst.query("MEASure:VOLTage?;:MEASure:POWEr?;:MEASure:CURRent?")
+        values = answer.replace(',', ';').split(';')
+        if len(values) != 3:
+            raise ValueError('Unexpected answer to the combined measurement query: ' + answer)
+        # U, P and I (current in mA)
+        return float(values[0]), float(values[1]), float(values[2]) * 1000
+
+    def add_values_to_buffers(self, process_time, voltage_calc, voltage_ps, power_ps, current_ps, mode):
+        # all values of the cycle are published as one row
+        self._telemetry.update(process_time, voltage_calc, voltage_ps, power_ps, current_ps, mode)
+        self._history.update(process_time, (voltage_calc, voltage_ps, power_ps, current_ps))
+        if self._recorder is not None:  # history on disk, the row is only queued for the writer thread
+            self._recorder.record(process_time, voltage_calc, voltage_ps, power_ps, current_ps, mode,
+                                  *self._setpoints)
 
     def clear_buffers(self):
-        self._buffer_time.clear()
-        self._buffer_voltage_calc.clear()
-        self._buffer_voltage_ps.clear()
-        self._buffer_power_ps.clear()
-        self._buffer_current_ps.clear()
+        self._telemetry.clear()
+        self._history.clear()
+        for buffer in self._mode_samples:
+            buffer.clear()
 
     def calculate_average_values_for_mode_determination(self, n):
-        avg_voltage_ps = self._buffer_voltage_ps.average_value_from_last_n_values(n)
-        avg_power_ps = self._buffer_power_ps.average_value_from_last_n_values(n)
-        avg_current_ps = self._buffer_current_ps.average_value_from_last_n_values(n)
+        # averages are calculated only from really measured samples, not from the held values
+        avg_voltage_ps = self._mode_samples[0].average_value_from_last_n_values(n)
+        avg_power_ps = self._mode_samples[1].average_value_from_last_n_values(n)
+        avg_current_ps = self._mode_samples[2].average_value_from_last_n_values(n)
         return avg_voltage_ps, avg_power_ps, avg_current_ps
 
     def mode_determination(self, avg_voltage_ps, avg_power_ps, avg_current_ps, mode_prev):
@@ -344,8 +539,29 @@ class ItechIT6726VPowerSupply(Instrument):
     #     self._inst = rm.open_resource(visa_resource_id, timeout=1000, resource_pyclass=pyvisa.resources.USBInstrument)
     #     self._connected = True
 
+    # after a reconnect: the PS may have been reset, the last voltage and the output state are sent again and the
+    # combined query is probed again
+    def restore_configuration(self):
+        self._combined_query_enabled = True
+        self._inst.write("*CLS")
+        self._inst.write("VOLT " + str(self._voltage))
+        self._inst.write(":OUTPut ON" if self._status['outputON'] else ":OUTPut OFF")
+
+    # stop the output, wait for the end of the PID loop and release the session
     def disconnect(self):
-        if self._output:
-            self._output = False  # stop output
+        try:
+            self.output = False
+        except transport_errors() as exc:   # link lost and not restored, the loop is stopped anyway
+            logger.error('%s: output could not be switched off - error : %s', self._section, exc)
+        if self._thread is not None:
+            self._thread.join()     # the loop must not use the instrument any more
         self._inst.close()
         self._connected = False
+
+    # stop the output, disconnect and release the telemetry store
+    def close(self):
+        if self._connected:
+            self.disconnect()
+        elif self._thread is not None:
+            self._thread.join()     # the loop must not use the telemetry any more
+        self._telemetry.close()
@@ -0,0 +1,136 @@
+import asyncio
+import functools
+import threading
+from command_queue import InstrumentCommandQueue
+
+
+# one asyncio event loop running in a dedicated thread, shared by all instruments
+class EventLoopThread(object):
+    _instance = None
+    _instance_lock = threading.Lock()
+
+    def __init__(self):
+        self._loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(target=self.__run, name='instrument-io-loop', daemon=True)
+        self._thread.start()
+
+    @classmethod
+    def instance(cls):
+        with cls._instance_lock:
+            if cls._instance is None:
+                cls._instance = EventLoopThread()
+            return cls._instance
+
+    @property
+    def loop(self):
+        return self._loop
+
+    def in_loop_thread(self):
+        return threading.current_thread() is self._thread
+
+    def __run(self):
+        asyncio.set_event_loop(self._loop)
+        self._loop.run_forever()
+
+    def submit(self, coroutine):
+        # schedule a coroutine from any thread, returns concurrent.futures.Future
+        return asyncio.run_coroutine_threadsafe(coroutine, self._loop)
+
+    def run_blocking(self, func, *args):
+        # run a blocking function (e.g. a driver setter doing several transfers) outside of the calling thread,
+        # returns concurrent.futures.Future; used by the GUI to keep the Tk main loop responsive
+        async def call():
+            return await self._loop.run_in_executor(None, functools.partial(func, *args))
+        return self.submit(call())
+
+
+# asyncio transport of one instrument over a pyvisa resource
+# all transfers of the instrument are executed by the owner thread of its command queue (one at a time, by
+# priority), different instruments run concurrently; the blocking methods (write, query, ...) have the same
+# interface as the pyvisa resource and can be called from any thread
+# a pooled transport is shared by all users of the resource, close() gives it back to the pool (release), the pool
+# shuts it down when its last user is gone
+class AsyncTransport(object):
+    def __init__(self, resource, name='instrument', release=None):
+        self._resource = resource
+        self._release = release
+        self._commands = InstrumentCommandQueue(name)
+
+    @property
+    def resource(self):
+        return self._resource
+
+    def replace_resource(self, resource):
+        # new session after a lost link; commands queued before still use the lost one and fail
+        self._resource = resource
+
+    @property
+    def commands(self):
+        return self._commands
+
+    @property
+    def timeout(self):
+        # VISA timeout in ms; a different timeout of one query is given to query() and applied by the owner thread
+        return self._resource.timeout
+
+    def statistics(self):
+        # queue wait and service time per priority lane
+        return self._commands.statistics()
+
+    def submit_write(self, command, priority=InstrumentCommandQueue.CONTROL):
+        return self._commands.submit(priority, self._resource.write, command)
+
+    def submit_write_raw(self, data, priority=InstrumentCommandQueue.BULK):
+        return self._commands.submit(priority, self._resource.write_raw, data)
+
+    def submit_query(self, command, priority=InstrumentCommandQueue.TELEMETRY, timeout=None):
+        if timeout is None:
+            return self._commands.submit(priority, self._resource.query, command)
+        return self._commands.submit(priority, self.__query_with_timeout, command, timeout)
+
+    def __query_with_timeout(self, command, timeout):
+        # executed by the owner thread, no other transfer of the session runs meanwhile
+        resource = self._resource
+        previous_timeout = resource.timeout
+        resource.timeout = timeout
+        try:
+            return resource.query(command)
+        finally:
+            resource.timeout = previous_timeout
+
+    async def write_async(self, command, priority=InstrumentCommandQueue.CONTROL):
+        return await asyncio.wrap_future(self.submit_write(command, priority))
+
+    async def write_raw_async(self, data, priority=InstrumentCommandQueue.BULK):
+        return await asyncio.wrap_future(self.submit_write_raw(data, priority))
+
+    async def query_async(self, command, priority=InstrumentCommandQueue.TELEMETRY, timeout=None):
+        return await asyncio.wrap_future(self.submit_query(command, priority, timeout))
+
+    def __wait(self, future):
+        if self._commands.in_owner_thread():    # would wait for itself forever
+            raise RuntimeError('Blocking instrument call from the owner thread of the instrument')
+        return future.result()
+
+    def write(self, command, priority=InstrumentCommandQueue.CONTROL):
+        return self.__wait(self.submit_write(command, priority))
+
+    def write_raw(self, data, priority=InstrumentCommandQueue.BULK):
+        return self.__wait(self.submit_write_raw(data, priority))
+
+    def query(self, command, priority=InstrumentCommandQueue.TELEMETRY, timeout=None):
+        return self.__wait(self.submit_query(command, priority, timeout))
+
+    def close(self):
+        if self._release is not None:
+            self._release()
+        else:
+            self.shutdown()
+
+    def shutdown(self):
+        # the session is closed after the commands queued before, then the owner thread ends
+        try:
+            if self._resource is not None:
+                self.__wait(self._commands.submit(InstrumentCommandQueue.BULK, self._resource.close))
+        finally:
+            self._commands.stop()
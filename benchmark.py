@@ -0,0 +1,202 @@
+import argparse
+import json
+import os
+import platform
+import tempfile
+import time
+import timeit
+import tkinter as tk
+import numpy as np
+from data_buffer import DataBuffer
+from hupulser_config import load_config
+from ITECH_IT6726V_power_supply import ItechIT6726VPowerSupply
+from rigol_4102 import RigolDG4102Pulser
+from simulated_instruments import interrupt_link
+
+# benchmarks of the I/O, control loop and rendering hot paths against the simulated instruments
+# usage: python benchmark.py [--output results.json] [--quick]
+# results are written as JSON, times are in seconds
+
+PS_RESOURCE = 'SIM::IT6726V'
+PULSER_RESOURCE = 'SIM::DG4102'
+RECORD_DIRECTORY = os.path.join(tempfile.gettempdir(), 'hupulser_benchmark_records')  # not the records of the lab
+PULSE_SHAPES = (['30-', '20', '50+'], ['100-', '5', '50+'], ['50-', '5', '25+', '5', '50-', '5', '25+'])
+
+
+def statistics(samples):
+    samples = np.asarray(samples, dtype=float)
+    return {'n': len(samples), 'mean': float(samples.mean()), 'p50': float(np.percentile(samples, 50)),
+            'p99': float(np.percentile(samples, 99)), 'max': float(samples.max())}
+
+
+def time_calls(func, repeat):
+    samples = []
+    for _ in range(repeat):
+        time_start = time.perf_counter()
+        func()
+        samples.append(time.perf_counter() - time_start)
+    return statistics(samples)
+
+
+def connect_power_supply(resource_id):
+    config = load_config()
+    config.set('DC1', 'record_directory', RECORD_DIRECTORY)
+    ps = ItechIT6726VPowerSupply(config=config)
+    ps.connect(resource_id, 'DC1')
+    ps.inst.write("*CLS")
+    ps.inst.write("*RST")
+    return ps
+
+
+def benchmark_read_actual_value(repeat):
+    results = {}
+    # combined query and (firmware without compound queries) individual queries
+    for name, resource_id in (('combined', PS_RESOURCE), ('individual', PS_RESOURCE + '::compound_queries=false')):
+        ps = connect_power_supply(resource_id)
+        ps.read_actual_value_for_pid()  # the first call switches to the individual queries if needed
+        results[name] = time_calls(ps.read_actual_value_for_pid, repeat)
+        ps.close()
+    return results
+
+
+def benchmark_pid_control(duration):
+    ps = connect_power_supply(PS_RESOURCE)
+    for mode, value in enumerate((1000, 100, 500)):
+        ps.set_setpoint_for_mode(mode, value)
+    ps.profiler.enabled = True
+    ps.output = True
+    time.sleep(duration)
+    commands = ps.inst.statistics()
+    ps.close()  # output off, waits until the loop finished its last cycle
+    scheduler = ps.scheduler
+    result = {'frequency': scheduler.frequency, 'cycles': scheduler.cycles,
+              'cycle_rate': scheduler.cycles / duration, 'jitter': scheduler.jitter,
+              'max_jitter': scheduler.max_jitter, 'overruns': scheduler.overruns,
+              'phases': ps.profiler.summary(), 'commands': commands}
+    return result
+
+
+def benchmark_reconnect(repeat, outage=0.2):
+    # time from the loss of the link to the restored configuration of the running control loop
+    ps = connect_power_supply(PS_RESOURCE)
+    for mode, value in enumerate((1000, 100, 500)):
+        ps.set_setpoint_for_mode(mode, value)
+    ps.output = True
+    samples = []
+    for _ in range(repeat):
+        time.sleep(5 * ps.scheduler.period)     # regulation running
+        reconnects = ps.reconnects
+        interrupt_link(PS_RESOURCE, outage)
+        while ps.reconnects == reconnects:
+            time.sleep(0.01)
+        samples.append(ps.reconnect_time)
+    ps.close()
+    return {'outage': outage, 'reconnect_time': statistics(samples)}
+
+
+def benchmark_data_buffer(repeat):
+    results = {}
+    for size in (100, 1000, 10000):
+        data_buffer = DataBuffer(size)
+        for i in range(size):
+            data_buffer.update(float(i))
+        results[str(size)] = {
+            'update': timeit.timeit(lambda: data_buffer.update(1.0), number=repeat) / repeat,
+            'average_10': timeit.timeit(lambda: data_buffer.average_value_from_last_n_values(10),
+                                        number=repeat) / repeat,
+            'average_all': timeit.timeit(lambda: data_buffer.average_value_from_last_n_values(size),
+                                         number=repeat) / repeat}
+    return results
+
+
+def benchmark_pulse_shape(repeat):
+    # parsing without instrument: cold (waveform cache cleared) and warm (waveforms taken from the cache)
+    pulser = RigolDG4102Pulser()
+    pulser.frequency = 200
+
+    def parse_cold():
+        pulser.waveform_cache.clear()
+        pulser.pulse_shape = PULSE_SHAPES[0]
+
+    results = {'parse_cold': time_calls(parse_cold, repeat)}
+    for shape in PULSE_SHAPES:
+        pulser.pulse_shape = shape
+    shapes = iter(PULSE_SHAPES * repeat)
+    results['parse_warm'] = time_calls(lambda: setattr(pulser, 'pulse_shape', next(shapes)), repeat)
+    # change of the shape of the connected pulser including the waveform upload
+    pulser = RigolDG4102Pulser()
+    pulser.connect(PULSER_RESOURCE, 'Pulser')
+    pulser.frequency = 200
+    pulser.initialization()
+    upload_times = []
+    shapes = iter(PULSE_SHAPES * repeat)
+
+    def change_shape():
+        pulser.pulse_shape = next(shapes)
+        upload_times.extend(pulser.upload_times)
+
+    results['shape_change'] = time_calls(change_shape, repeat)
+    results['upload'] = statistics(upload_times)
+    results['binary_upload'] = pulser.binary_upload
+    pulser.disconnect()
+    return results
+
+
+def benchmark_plots(repeat):
+    try:
+        root = tk.Tk()
+    except tk.TclError as exc:  # e.g. no display
+        return {'skipped': str(exc)}
+    root.withdraw()
+    from matplotlib_plots import MatplotlibPlot1axes, MatplotlibPlot3axes
+    results = {}
+    # realtime plot as drawn by FuncAnimation with blitting: update of the lines, drawing and blitting of them
+    plot = MatplotlibPlot3axes(root)
+    plot.canvas.draw()
+    samples = []
+    for k in range(repeat):
+        t = np.arange(k, k + 100) * 0.1
+        time_start = time.perf_counter()
+        artists = plot.plot_waveforms_realtime(k, t, t * 10, t * 5, t * 3, t * 9, t * 4)
+        for artist in artists:
+            artist.axes.draw_artist(artist)
+        plot.canvas.blit(plot.figure.bbox)
+        samples.append(time.perf_counter() - time_start)
+    results['plot_3axes_realtime'] = statistics(samples)
+    results['plot_3axes_full_redraws'] = plot.full_redraws
+    # pulse shape plot: complete drawing and change of the x scale
+    plot = MatplotlibPlot1axes(root)
+    pulser = RigolDG4102Pulser()
+    pulser.frequency = 200
+    pulser.pulse_shape = PULSE_SHAPES[0]
+    t, wf1, wf2 = pulser.get_waveforms()
+    period = pulser.get_period()
+    results['plot_1axes_waveforms'] = time_calls(lambda: plot.plot_waveforms(t, wf1, wf2, True, period, 100),
+                                                 repeat)
+    scales = iter(range(repeat))
+    results['plot_1axes_scale'] = time_calls(lambda: plot.update_x_lim(period, 1 + next(scales) % 100), repeat)
+    root.destroy()
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description='HuPulser benchmarks with simulated instruments')
+    parser.add_argument('--output', default='benchmark_results.json', help='JSON file with the results')
+    parser.add_argument('--quick', action='store_true', help='fewer repetitions and a shorter control loop run')
+    args = parser.parse_args()
+    repeat = 20 if args.quick else 200
+    results = {'time': time.strftime('%Y-%m-%dT%H:%M:%S'), 'python': platform.python_version(),
+               'machine': platform.machine(), 'quick': args.quick,
+               'read_actual_value_for_pid': benchmark_read_actual_value(repeat),
+               'pid_control': benchmark_pid_control(3.0 if args.quick else 10.0),
+               'reconnect': benchmark_reconnect(3 if args.quick else 20),
+               'data_buffer': benchmark_data_buffer(10 * repeat),
+               'pulse_shape': benchmark_pulse_shape(repeat // 4),
+               'plots': benchmark_plots(repeat)}
+    with open(args.output, 'w') as results_file:
+        json.dump(results, results_file, indent=2)
+    print('Results written to ' + args.output)
+
+
+if __name__ == '__main__':
+    main()
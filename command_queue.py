@@ -0,0 +1,100 @@
+import concurrent.futures
+import itertools
+import queue
+import threading
+import time
+
+
+# error of the commands submitted after the queue was stopped (the session is closed, like a lost connection)
+class CommandQueueStopped(ConnectionError):
+    pass
+
+
+# single owner thread of an instrument session; commands are executed one by one in order of their priority
+# (commands with the same priority in order of arrival), callers get concurrent.futures.Future
+class InstrumentCommandQueue(object):
+    # priority lanes, lower number is served first
+    SAFETY = 0  # output off, stop
+    CONTROL = 1     # setpoints, configuration
+    TELEMETRY = 2   # measurement queries
+    BULK = 3    # waveform uploads
+    LANE_NAMES = ('safety', 'control', 'telemetry', 'bulk')
+
+    def __init__(self, name='instrument'):
+        self._name = name
+        self._queue = queue.PriorityQueue()
+        self._stop_lock = threading.Lock()
+        self._stopped = False   # no commands are accepted any more
+        self._sequence = itertools.count()  # keeps the order of arrival within one lane
+        self._statistics_lock = threading.Lock()
+        self._statistics = [self.__empty_statistics() for _ in self.LANE_NAMES]
+        self._thread = threading.Thread(target=self.__serve, name=name + '-commands', daemon=True)
+        self._thread.start()
+
+    @staticmethod
+    def __empty_statistics():
+        return {'commands': 0, 'wait_time': 0.0, 'max_wait_time': 0.0, 'service_time': 0.0, 'max_service_time': 0.0}
+
+    def in_owner_thread(self):
+        return threading.current_thread() is self._thread
+
+    def submit(self, priority, func, *args):
+        future = concurrent.futures.Future()
+        with self._stop_lock:
+            if not self._stopped:
+                self._queue.put((priority, next(self._sequence), time.perf_counter(), future, func, args))
+                return future
+        future.set_exception(self.__stopped_error())    # the owner thread is gone, nobody would ever resolve it
+        return future
+
+    def stop(self):
+        # commands submitted before are still executed, later ones fail with CommandQueueStopped
+        with self._stop_lock:
+            if self._stopped:
+                return
+            self._stopped = True
+            self._queue.put((self.BULK + 1, next(self._sequence), time.perf_counter(), None, None, None))
+
+    def __stopped_error(self):
+        return CommandQueueStopped('Command queue of {} is stopped'.format(self._name))
+
+    def statistics(self):
+        # per lane: number of commands, average (exponential) and max queue wait and service time in seconds
+        with self._statistics_lock:
+            return {name: dict(values) for name, values in zip(self.LANE_NAMES, self._statistics)}
+
+    def __serve(self):
+        while True:
+            priority, _, time_queued, future, func, args = self._queue.get()
+            if future is None:  # stop mark
+                self.__fail_pending()
+                return
+            if not future.set_running_or_notify_cancel():
+                continue
+            time_start = time.perf_counter()
+            try:
+                future.set_result(func(*args))
+            except BaseException as exc:
+                future.set_exception(exc)
+            time_end = time.perf_counter()
+            self.__update_statistics(priority, time_start - time_queued, time_end - time_start)
+
+    def __fail_pending(self):
+        # nothing can be queued after the stop mark, but no future may be left unresolved
+        while True:
+            try:
+                future = self._queue.get_nowait()[3]
+            except queue.Empty:
+                return
+            if future is not None and future.set_running_or_notify_cancel():
+                future.set_exception(self.__stopped_error())
+
+    def __update_statistics(self, priority, wait_time, service_time):
+        with self._statistics_lock:
+            values = self._statistics[priority]
+            weight = 0.1 if values['commands'] else 1.0     # the first command initializes the averages
+            values['commands'] += 1
+            values['wait_time'] = (1 - weight) * values['wait_time'] + weight * wait_time
+            values['max_wait_time'] = max(values['max_wait_time'], wait_time)
+            values['service_time'] = (1 - weight) * values['service_time'] + weight * service_time
+            values['max_service_time'] = max(values['max_service_time'], service_time)
@@ -0,0 +1,255 @@
+import asyncio
+import collections
+import json
+import logging
+import os
+from async_transport import EventLoopThread
+from hupulser_engine import power_supply_status, pulser_status
+from telemetry import TelemetryStore
+
+logger = logging.getLogger(__name__)
+
+TELEMETRY_FIELDS = ('time', 'voltage_calc', 'voltage_ps', 'power_ps', 'current_ps', 'mode')    # columns of a row
+
+
+# connection of one client; answers and telemetry batches are written by one task in the order they were queued,
+# answers are never dropped, from the batches only the last "queue_size" are kept while the client does not read
+# (backpressure of the socket), the number of dropped batches is sent to the client with the next batch
+class _Client(object):
+    def __init__(self, writer, queue_size):
+        self.writer = writer
+        self.sections = set()   # subscribed telemetry streams
+        self._answers = collections.deque()
+        self._batches = collections.deque(maxlen=queue_size)
+        self._dropped = 0
+        self._ready = asyncio.Event()
+
+    def send_answer(self, message):
+        self._answers.append(message)
+        self._ready.set()
+
+    def send_batch(self, message):
+        if len(self._batches) == self._batches.maxlen:
+            self._dropped += 1  # the oldest batch is removed by append
+        self._batches.append(message)
+        self._ready.set()
+
+    async def send_loop(self):
+        try:
+            while True:
+                await self._ready.wait()
+                self._ready.clear()
+                while self._answers or self._batches:
+                    if self._answers:
+                        self.writer.write(self._answers.popleft())
+                    else:
+                        if self._dropped:
+                            self.writer.write(_encode({'event': 'dropped', 'batches': self._dropped}))
+                            self._dropped = 0
+                        self.writer.write(self._batches.popleft())
+                    await self.writer.drain()   # waits while the client does not read
+        except ConnectionError:     # client gone, the reader side ends the connection
+            pass
+
+
+def _encode(message):
+    return (json.dumps(message) + '\n').encode('utf-8')
+
+
+# local control and telemetry server for supervisory software; address "host:port" (TCP) or "unix:<path>"
+# protocol: one JSON object per line in both directions
+#   request     {"id": 1, "command": "set_setpoint", "section": "DC1", "mode": 1, "value": 100}
+#   answer      {"id": 1, "ok": true, "result": ...} or {"id": 1, "ok": false, "error": "..."}
+#   telemetry   {"event": "telemetry", "section": "DC1", "rows": [[time, voltage_calc, ...], ...]}
+# commands: status, get, set_setpoint, set_pid, set_output, pulser_set, subscribe, unsubscribe
+# the server runs in the asyncio I/O thread, the driver calls in worker threads; the telemetry stores are read once
+# per stream interval for all subscribers (lock-free readers, the PID threads are not slowed down)
+class ControlServer(object):
+    def __init__(self, power_supplies, pulser=None, address='127.0.0.1:5025', stream_interval=0.1, queue_size=50):
+        self._power_supplies = power_supplies   # section -> power supply (driver or control process)
+        self._pulser = pulser
+        self._address = address
+        self._stream_interval = stream_interval     # s, period of the telemetry batches
+        self._queue_size = queue_size   # max. number of batches waiting for a slow client
+        self._server = None
+        self._stream_task = None
+        self._clients = set()
+        self._last_sent = {section: (0, 0.0) for section in power_supplies}    # (sequence, time) of the last row
+        self._commands = {'status': self.__status, 'get': self.__get, 'set_setpoint': self.__set_setpoint,
+                          'set_pid': self.__set_pid, 'set_output': self.__set_output,
+                          'pulser_set': self.__pulser_set, 'subscribe': self.__subscribe,
+                          'unsubscribe': self.__unsubscribe}
+
+    @property
+    def address(self):
+        return self._address
+
+    @property
+    def clients(self):
+        return len(self._clients)
+
+    def start(self):
+        # returns when the server is listening
+        EventLoopThread.instance().submit(self.__start()).result()
+        logger.info('Control server listening on %s', self._address)
+
+    def close(self):
+        EventLoopThread.instance().submit(self.__close()).result()
+
+    async def __start(self):
+        if self._address.startswith('unix:'):
+            path = self._address[5:]
+            if os.path.exists(path):    # left by a previous run
+                os.remove(path)
+            self._server = await asyncio.start_unix_server(self.__serve_client, path=path)
+        else:
+            host, _, port = self._address.rpartition(':')
+            self._server = await asyncio.start_server(self.__serve_client, host or '127.0.0.1', int(port))
+        self._stream_task = asyncio.ensure_future(self.__stream())
+
+    async def __close(self):
+        self._stream_task.cancel()
+        self._server.close()
+        for client in list(self._clients):
+            client.writer.close()
+        await self._server.wait_closed()
+        if self._address.startswith('unix:') and os.path.exists(self._address[5:]):
+            os.remove(self._address[5:])
+
+    async def __serve_client(self, reader, writer):
+        client = _Client(writer, self._queue_size)
+        self._clients.add(client)
+        sender = asyncio.ensure_future(client.send_loop())
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                client.send_answer(_encode(await self.__answer(client, line)))
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            self._clients.discard(client)
+            sender.cancel()
+            writer.close()
+
+    async def __answer(self, client, line):
+        request_id = None
+        try:
+            request = json.loads(line)
+            request_id = request.get('id')
+            command = self._commands.get(request.get('command'))
+            if command is None:
+                raise ValueError('Unknown command {!r}'.format(request.get('command')))
+            return {'id': request_id, 'ok': True, 'result': await command(client, request)}
+        except Exception as exc:    # the error is reported to the client, the server keeps running
+            return {'id': request_id, 'ok': False, 'error': '{}: {}'.format(type(exc).__name__, exc)}
+
+    @staticmethod
+    async def __call(func, *args):
+        # driver calls block (instrument transfers, reconnect, operations of other callers), they must not stop the
+        # I/O loop; the drivers run their operations one at a time (see instrument.exclusive)
+        return await asyncio.get_running_loop().run_in_executor(None, func, *args)
+
+    def __power_supply(self, request):
+        section = request.get('section')
+        if section not in self._power_supplies:
+            raise KeyError('Unknown power supply section {!r}'.format(section))
+        return self._power_supplies[section]
+
+    async def __status(self, client, request):
+        def status():
+            result = {section: power_supply_status(ps) for section, ps in self._power_supplies.items()}
+            if self._pulser is not None:
+                result['Pulser'] = pulser_status(self._pulser)
+            return result
+        return await self.__call(status)
+
+    async def __get(self, client, request):
+        ps = self.__power_supply(request)
+
+        def get():
+            return {'setpoints': list(ps.setpoints), 'pid': [list(ps.get_pid_values(mode)) for mode in range(3)],
+                    'output': ps.output, 'mode': ps.mode}
+        return await self.__call(get)
+
+    async def __set_setpoint(self, client, request):
+        await self.__call(self.__power_supply(request).set_setpoint_for_mode, request['mode'], request['value'])
+
+    async def __set_pid(self, client, request):
+        await self.__call(self.__power_supply(request).set_pid_values, request['mode'], request['index'],
+                          request['value'])
+
+    async def __set_output(self, client, request):
+        ps = self.__power_supply(request)
+
+        def set_output(value):
+            if value != ps.output:  # a new run clears the buffers in its PID loop
+                ps.output = value
+        await self.__call(set_output, bool(request['value']))
+
+    async def __pulser_set(self, client, request):
+        # any of frequency, pulse_shape (list or comma separated), ch2_enabled and output, applied in this order;
+        # output off is applied first and does not wait for a running operation
+        pulser = self._pulser
+        if pulser is None:
+            raise KeyError('No pulser configured')
+
+        def pulser_set():
+            if 'output' in request and not request['output']:
+                pulser.output = False
+            with pulser.operation_lock:     # no operation of the GUI or of another client in between
+                if 'frequency' in request:
+                    pulser.frequency = request['frequency']
+                if 'pulse_shape' in request:
+                    shape = request['pulse_shape']
+                    pulser.pulse_shape = shape.split(',') if isinstance(shape, str) else list(shape)
+                if 'ch2_enabled' in request:
+                    pulser.ch2_enabled = bool(request['ch2_enabled'])
+                if 'output' in request:
+                    pulser.output = bool(request['output'])
+                return pulser_status(pulser)
+        return await self.__call(pulser_set)
+
+    async def __subscribe(self, client, request):
+        sections = request.get('sections') or list(self._power_supplies)
+        for section in sections:
+            self.__power_supply({'section': section})   # check the section
+        client.sections.update(sections)
+        return {'sections': sorted(client.sections), 'fields': TELEMETRY_FIELDS, 'interval': self._stream_interval}
+
+    async def __unsubscribe(self, client, request):
+        client.sections.difference_update(request.get('sections') or list(self._power_supplies))
+        return {'sections': sorted(client.sections)}
+
+    async def __stream(self):
+        # new rows of every store are read and encoded once and queued for all subscribers of the section
+        while True:
+            await asyncio.sleep(self._stream_interval)
+            for section, ps in self._power_supplies.items():
+                subscribers = [client for client in self._clients if section in client.sections]
+                if not subscribers:
+                    continue
+                rows = self.__new_rows(section, ps.telemetry)
+                if rows is None:
+                    continue
+                message = _encode({'event': 'telemetry', 'section': section, 'rows': rows.tolist()})
+                for client in subscribers:
+                    client.send_batch(message)
+
+    def __new_rows(self, section, telemetry):
+        # rows written since the last batch (only rows still kept in the store), None if there are none
+        last_sequence, last_time = self._last_sent[section]
+        sequence = telemetry.sequence
+        if sequence == last_sequence:
+            return None
+        rows = telemetry.snapshot()
+        rows = rows[rows[:, TelemetryStore.TIME] > 0]   # unused rows of the store are zero
+        if len(rows) and rows[-1, TelemetryStore.TIME] < last_time:    # store cleared, new run
+            last_time = 0.0
+        rows = rows[rows[:, TelemetryStore.TIME] > last_time]
+        if not len(rows):
+            self._last_sent[section] = (sequence, last_time)
+            return None
+        self._last_sent[section] = (sequence, float(rows[-1, TelemetryStore.TIME]))
+        return rows
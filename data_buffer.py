@@ -1,32 +1,46 @@
-import collections
 import numpy as np
 
 
+# fixed-size ring buffer; every value is stored twice (at i and i + size) so that the last "size" values
+# are always available as one contiguous chronological slice without copying
 class DataBuffer(object):
     def __init__(self, size):
         self._size = size
-        self._buffer = collections.deque(np.zeros(self._size))
+        self._data = np.zeros(2 * self._size)
+        self._running_sum = np.zeros(2 * self._size)     # sum of all values up to and including the given one
+        self._total = 0.0   # running sum of all values since the last clear
+        self._head = 0  # position of the next write, the oldest value is stored here
 
     @property
     def buffer(self):
-        return self._buffer
+        # chronological view (oldest ... newest), no copy
+        return self._data[self._head:self._head + self._size]
 
     def __str__(self):
-        items = ['{!r}'.format(item) for item in self._buffer]
+        items = ['{!r}'.format(item) for item in self.buffer]
         return '[' + ', '.join(items) + ']'
 
     def update(self, new_data):
-        self._buffer.popleft()
-        self._buffer.append(new_data)
+        self._total += new_data
+        self._data[self._head] = new_data
+        self._data[self._head + self._size] = new_data
+        self._running_sum[self._head] = self._total
+        self._running_sum[self._head + self._size] = self._total
+        self._head = (self._head + 1) % self._size
 
     def clear(self):
-        for i in range(self._size):
-            self._buffer.popleft()
-            self._buffer.append(0)
+        self._data.fill(0)
+        self._running_sum.fill(0)
+        self._total = 0.0
+        self._head = 0
 
     def average_value_from_last_n_values(self, n):
-        total = 0
-        for i in range(-1, -n - 1, -1):
-            total += self._buffer[i]
-        avg = total/n
+        # difference of the running sums of the newest value and of the value just before the last n values
+        if n > self._size:
+            raise IndexError('Only the last {} values are kept in the buffer'.format(self._size))
+        if n < self._size:
+            total_before = self._running_sum[self._head + self._size - 1 - n]
+        else:
+            total_before = self._running_sum[self._head] - self._data[self._head]
+        avg = (self._total - total_before)/n
         return avg
@@ -0,0 +1,134 @@
+import threading
+import numpy as np
+
+
+# one level of the pyramid; every block keeps the time of its first and last sample and min/max of every channel
+# only the newest "capacity" blocks are kept in a preallocated ring; every block is stored twice (at i and
+# i + capacity) so that the kept blocks are always one contiguous chronological slice (see DataBuffer)
+class _PyramidLevel(object):
+    def __init__(self, no_of_channels, capacity):
+        self.count = 0  # number of blocks appended since the start, also the absolute index of the next block
+        self._capacity = capacity
+        self._t_first = np.zeros(2 * capacity)
+        self._t_last = np.zeros(2 * capacity)
+        self._v_min = np.zeros((2 * capacity, no_of_channels))
+        self._v_max = np.zeros((2 * capacity, no_of_channels))
+
+    @property
+    def first(self):
+        # absolute index of the oldest kept block
+        return max(self.count - self._capacity, 0)
+
+    def __start(self):
+        return self.count % self._capacity if self.count >= self._capacity else 0
+
+    @property
+    def t_first(self):
+        # kept blocks in chronological order (views, no copy); index i belongs to the block first + i
+        return self._t_first[self.__start():self.__start() + self.count - self.first]
+
+    @property
+    def t_last(self):
+        return self._t_last[self.__start():self.__start() + self.count - self.first]
+
+    @property
+    def v_min(self):
+        return self._v_min[self.__start():self.__start() + self.count - self.first]
+
+    @property
+    def v_max(self):
+        return self._v_max[self.__start():self.__start() + self.count - self.first]
+
+    def append(self, t_first, t_last, v_min, v_max):
+        # O(1), the oldest block is overwritten when the level is full
+        for i in (self.count % self._capacity, self.count % self._capacity + self._capacity):
+            self._t_first[i] = t_first
+            self._t_last[i] = t_last
+            self._v_min[i] = v_min
+            self._v_max[i] = v_max
+        self.count += 1
+
+
+# min/max decimation pyramid of the history of several channels
+# level 0 holds the samples, every block of level k summarizes "factor" blocks of level k - 1;
+# min and max are kept so that spikes stay visible at every resolution
+# every level keeps only its newest "capacity" blocks (bounded memory, O(1) update in the PID loop), the coarsest
+# levels still cover the whole run; the complete history is kept by the TelemetryRecorder
+class MinMaxPyramid(object):
+    def __init__(self, no_of_channels, factor=4, capacity=4096):
+        if capacity < factor:
+            raise ValueError('Capacity of a level must be at least the decimation factor')
+        self._no_of_channels = no_of_channels
+        self._factor = factor
+        self._capacity = capacity
+        self._lock = threading.Lock()
+        self._levels = [self.__new_level()]
+
+    def __new_level(self):
+        return _PyramidLevel(self._no_of_channels, self._capacity)
+
+    @property
+    def count(self):
+        return self._levels[0].count
+
+    def time_range(self):
+        with self._lock:
+            if self._levels[0].count == 0:
+                return 0.0, 0.0
+            # the coarsest level has less than "factor" blocks, its first block is the start of the run
+            return self._levels[-1].t_first[0], self._levels[0].t_last[-1]
+
+    def clear(self):
+        with self._lock:
+            self._levels = [self.__new_level()]
+
+    def update(self, process_time, values):
+        # add one sample; complete blocks are propagated to the higher levels
+        with self._lock:
+            self._levels[0].append(process_time, process_time, values, values)
+            k = 0
+            while self._levels[k].count % self._factor == 0:
+                level = self._levels[k]
+                if k + 1 == len(self._levels):
+                    self._levels.append(self.__new_level())
+                self._levels[k + 1].append(level.t_first[-self._factor], level.t_last[-1],
+                                           level.v_min[-self._factor:].min(axis=0),
+                                           level.v_max[-self._factor:].max(axis=0))
+                k += 1
+
+    def get_window(self, time_from, time_to, max_points):
+        # return (time, values) of the window with at most about max_points points, taken from the finest level
+        # which fits and still keeps the start of the window; every block is drawn as two points (min, max)
+        with self._lock:
+            k = 0
+            while k < len(self._levels) - 1:
+                level = self._levels[k]
+                first, last = self.__block_range(level, 0, time_from, time_to)
+                covered = level.first == 0 or level.t_first[0] <= time_from
+                if covered and (1 if k == 0 else 2) * (last - first) <= max_points:
+                    break
+                k += 1
+            # blocks of level k and the not yet aggregated newest blocks of the lower levels
+            pieces = [self.__blocks(k, 0, time_from, time_to)]
+            for j in range(k, 0, -1):
+                pieces.append(self.__blocks(j - 1, self._levels[j].count * self._factor, time_from, time_to))
+            t = np.concatenate([piece[0] for piece in pieces])
+            values = np.concatenate([piece[1] for piece in pieces])
+            return t, values
+
+    @staticmethod
+    def __block_range(level, start, time_from, time_to):
+        # blocks from the absolute index start on, as indices into the kept blocks of the level
+        offset = max(start - level.first, 0)
+        first = offset + np.searchsorted(level.t_last[offset:], time_from, side='left')
+        last = offset + np.searchsorted(level.t_first[offset:], time_to, side='right')
+        return first, max(first, last)
+
+    def __blocks(self, k, start, time_from, time_to):
+        level = self._levels[k]
+        first, last = self.__block_range(level, start, time_from, time_to)
+        if k == 0:  # raw samples
+            return level.t_first[first:last].copy(), level.v_min[first:last].copy()
+        t = np.column_stack((level.t_first[first:last], level.t_last[first:last])).ravel()
+        values = np.stack((level.v_min[first:last], level.v_max[first:last]), axis=1)
+        return t, values.reshape(-1, self._no_of_channels)
@@ -0,0 +1,26 @@
+import configparser
+import os
+import re
+
+# ini file with the settings of all instruments, read once at the start and written when the GUI is closed
+CONFIG_PATH = os.path.join(os.path.dirname(__file__), 'hupulser.ini')
+
+
+def load_config(config_path=None):
+    config = configparser.ConfigParser()
+    if config_path is None:
+        config_path = CONFIG_PATH
+    if not config.read(config_path, encoding='utf-8'):
+        raise FileNotFoundError('Config file {} not found'.format(config_path))
+    return config
+
+
+def save_config(config, config_path=None):
+    with open(CONFIG_PATH if config_path is None else config_path, 'w') as config_file:
+        config.write(config_file)
+
+
+# power supply sections (DC1, DC2, ...) of the config in the order of their numbers
+def power_supply_sections(config):
+    sections = [section for section in config.sections() if re.fullmatch(r'DC\d+', section)]
+    return sorted(sections, key=lambda section: int(section[2:]))
@@ -0,0 +1,168 @@
+import argparse
+import logging
+import signal
+import threading
+from hupulser_config import load_config, power_supply_sections
+from ITECH_IT6726V_power_supply import ItechIT6726VPowerSupply
+from power_supply_process import PowerSupplyProcess
+from rigol_4102 import RigolDG4102Pulser
+from telemetry import TelemetryStore
+
+logger = logging.getLogger(__name__)
+
+# headless control engine (no tkinter, no matplotlib): power supplies of the [DCn] sections and the pulser of the
+# [Pulser] section of the ini file
+# usage: python hupulser_engine.py [--config hupulser.ini] [--duration 60] [--pulse] [--status-interval 1]
+#                                  [--server 127.0.0.1:5025 | --server unix:/tmp/hupulser.sock]
+
+
+# last telemetry row, loop timing and link state of a power supply (driver or control process)
+def power_supply_status(ps):
+    row = ps.telemetry.latest()
+    scheduler = ps.scheduler
+    return {'connected': ps.connected, 'output': ps.output, 'mode': ps.mode,
+            'time': float(row[TelemetryStore.TIME]),
+            'voltage_calc': float(row[TelemetryStore.VOLTAGE_CALC]),
+            'voltage': float(row[TelemetryStore.VOLTAGE_PS]),
+            'power': float(row[TelemetryStore.POWER_PS]),
+            'current': float(row[TelemetryStore.CURRENT_PS]),
+            'loop_frequency': scheduler.frequency, 'cycles': scheduler.cycles,
+            'jitter': scheduler.jitter, 'max_jitter': scheduler.max_jitter,
+            'overruns': scheduler.overruns, 'link_up': ps.link_up,
+            'reconnects': ps.reconnects, 'reconnect_time': ps.reconnect_time}
+
+
+def pulser_status(pulser):
+    return {'connected': pulser.connected, 'output': pulser.output,
+            'frequency': pulser.frequency, 'pulse_shape': pulser.pulse_shape,
+            'ch2_enabled': pulser.ch2_enabled, 'link_up': pulser.link_up,
+            'reconnects': pulser.reconnects, 'reconnect_time': pulser.reconnect_time}
+
+
+class HuPulserEngine:
+    def __init__(self, config):
+        self._config = config
+        self._power_supplies = {}
+        for section in power_supply_sections(config):
+            if config.getboolean(section, 'control_process', fallback=False):
+                ps = PowerSupplyProcess(section, config)
+            else:
+                ps = ItechIT6726VPowerSupply(section, config=config)
+            try:
+                ps.set_setpoint_for_mode(0, config[section]['setpoint_voltage'])
+                ps.set_setpoint_for_mode(1, config[section]['setpoint_power'])
+                ps.set_setpoint_for_mode(2, config[section]['setpoint_current'])
+            except KeyError:
+                logger.warning('Some config values for %s not found in ini file', section)
+            self._power_supplies[section] = ps
+        self._pulser = None
+        if 'Pulser' in config:
+            self._pulser = RigolDG4102Pulser()
+            try:
+                self._pulser.frequency = config['Pulser']['frequency']
+                self._pulser.pulse_shape = config['Pulser']['pulse_shape'].split(',')
+                self._pulser.ch2_enabled = config['Pulser']['ch2_enabled'] == 'True'
+            except KeyError:
+                logger.warning('Some config values for Pulser not found in ini file')
+        self._server = None
+
+    @property
+    def power_supplies(self):
+        return self._power_supplies
+
+    @property
+    def pulser(self):
+        return self._pulser
+
+    @property
+    def server(self):
+        return self._server
+
+    # local control and telemetry server (control_server.py); the address is taken from the [Server] section if not
+    # given
+    def start_server(self, address=None):
+        from control_server import ControlServer
+        if address is None:
+            address = self._config.get('Server', 'address', fallback='127.0.0.1:5025')
+        self._server = ControlServer(self._power_supplies, self._pulser, address,
+                                     self._config.getfloat('Server', 'stream_interval', fallback=0.1))
+        self._server.start()
+
+    def connect(self):
+        for section, ps in self._power_supplies.items():
+            ps.connect(self._config[section]['resource_id'], section)
+            ps.inst.write("*CLS")     # clean the PS register
+            ps.inst.write("*RST")     # set the PS default settings
+            logger.info('%s connected', section)
+        if self._pulser is not None:
+            self._pulser.connect(self._config['Pulser']['resource_id'], 'Pulser')
+            self._pulser.initialization()   # sends the frequency and the pulse shape
+            logger.info('Pulser connected')
+
+    # output of all supplies on (every supply runs its PID loop), pulsing on if requested
+    def start(self, pulse=False):
+        for section, ps in self._power_supplies.items():
+            ps.output = True    # new run, the PID loop clears the buffers
+            logger.info('%s output on', section)
+        if pulse and self._pulser is not None:
+            self._pulser.output = True
+            logger.info('Pulsing on')
+
+    def stop(self):
+        if self._pulser is not None and self._pulser.connected:
+            self._pulser.output = False
+        for ps in self._power_supplies.values():
+            if ps.connected:
+                ps.output = False
+
+    # stop everything and release the instruments
+    def close(self):
+        if self._server is not None:
+            self._server.close()
+        self.stop()
+        for ps in self._power_supplies.values():
+            ps.close()
+        if self._pulser is not None and self._pulser.connected:
+            self._pulser.disconnect()
+
+    def status(self):
+        status = {section: power_supply_status(ps) for section, ps in self._power_supplies.items()}
+        if self._pulser is not None:
+            status['Pulser'] = pulser_status(self._pulser)
+        return status
+
+
+def main():
+    parser = argparse.ArgumentParser(description='HuPulser headless control engine')
+    parser.add_argument('--config', default=None, help='ini file (default hupulser.ini next to this file)')
+    parser.add_argument('--duration', type=float, default=0, help='run time in seconds (0 = until Ctrl+C)')
+    parser.add_argument('--pulse', action='store_true', help='turn the pulser output on')
+    parser.add_argument('--status-interval', type=float, default=1.0, help='status log interval in seconds')
+    parser.add_argument('--server', default=None,
+                        help='start the control server at host:port or unix:<path> (also started by [Server] enabled)')
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s %(name)s %(levelname)s: %(message)s')
+
+    config = load_config(args.config)
+    engine = HuPulserEngine(config)
+    stop_event = threading.Event()
+    signal.signal(signal.SIGINT, lambda signum, frame: stop_event.set())
+    signal.signal(signal.SIGTERM, lambda signum, frame: stop_event.set())
+    try:
+        engine.connect()
+        engine.start(pulse=args.pulse)
+        if args.server is not None or config.getboolean('Server', 'enabled', fallback=False):
+            engine.start_server(args.server)
+        elapsed = 0.0
+        while not stop_event.wait(args.status_interval):
+            for name, values in engine.status().items():
+                logger.info('%s: %s', name, values)
+            elapsed += args.status_interval
+            if 0 < args.duration <= elapsed:
+                break
+    finally:
+        engine.close()
+
+
+if __name__ == '__main__':
+    main()
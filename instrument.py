@@ -1,17 +1,167 @@
-import pyvisa
+import functools
+import logging
+import threading
+import time
+from visa_sessions import VisaSessionPool
+
+logger = logging.getLogger(__name__)
+
+
+# pyvisa and pyusb are imported with the first connection or error, not at the start of the program
+# (the except clauses evaluate these only when an exception is raised)
+def visa_io_error():
+    import pyvisa
+    return pyvisa.errors.VisaIOError
+
+
+# errors meaning that the link to the instrument is lost (the session must be opened again)
+def transport_errors():
+    import pyvisa
+    import usb.core
+    return usb.core.USBError, pyvisa.errors.VisaIOError, pyvisa.errors.InvalidSession, OSError
+
+
+# VISA errors meaning that the session is lost; other VISA errors (e.g. a timeout of one query) keep the session
+def link_loss_status_codes():
+    import pyvisa
+    status_code = pyvisa.constants.StatusCode
+    return (status_code.error_connection_lost, status_code.error_invalid_object, status_code.error_resource_not_found,
+            status_code.error_io)
+
+
+# True if the transport error (see transport_errors) means that the link to the instrument is lost
+def is_link_loss(exc):
+    if isinstance(exc, visa_io_error()):
+        return exc.error_code in link_loss_status_codes()
+    return True
+
+
+# operation of the user (GUI thread) on a connected instrument: when the link is lost, it waits for the reconnect
+# (at most RECONNECT_TIMEOUT, the configuration is restored) and runs the operation once again
+def reconnecting(method):
+    @functools.wraps(method)
+    def wrapper(self, *args):
+        try:
+            return method(self, *args)
+        except transport_errors() as exc:
+            if not self.link_lost(exc):     # error of the operation itself, e.g. a timeout
+                raise
+            if not self.wait_for_reconnect(self.RECONNECT_TIMEOUT):
+                raise
+        return method(self, *args)
+    return wrapper
+
+
+# operation changing the state of the instrument and its driver: one at a time per instrument, whoever calls it (GUI,
+# control server, engine); reentrant, an operation may use other ones
+def exclusive(method):
+    @functools.wraps(method)
+    def wrapper(self, *args):
+        with self._operation_lock:
+            return method(self, *args)
+    return wrapper
 
 
 class Instrument:
+    RECONNECT_DELAY_MIN = 0.1   # s, delay of the second attempt to reconnect (the first one is immediate)
+    RECONNECT_DELAY_MAX = 5.0   # s, the delay doubles after every failed attempt up to this value
+    RECONNECT_TIMEOUT = 5.0     # s, max. wait of an operation of the user for the reconnect
+
     def __init__(self):
         self._output = False    # no output voltage after start
         self._connected = False     # connection with PS
         self._inst = None   # representation of the PS for read/write commands
+        self._name = 'instrument'
+        self._resource_id = None
+        self._link_up = True
+        self._link_lost_time = 0.0
+        self._reconnect_lock = threading.Lock()
+        self._operation_lock = threading.RLock()    # held by the exclusive operations
+        self._reconnect_delay = self.RECONNECT_DELAY_MIN
+        self._next_reconnect = 0.0  # time (perf_counter) of the next attempt
+        self._reconnect_attempts = 0    # attempts since the link was lost
+        self._reconnects = 0
+        self._reconnect_time = 0.0  # time from the loss of the link to the restored configuration in the last reconnect
+
+    def connect(self, visa_resource_id, name='instrument'):
+        # the session and its transport (one owner thread doing all transfers) are shared with other users of the
+        # resource; all transfers go through the asyncio I/O layer
+        self._inst = VisaSessionPool.instance().open(visa_resource_id, name)
+        self._name = name
+        self._resource_id = visa_resource_id
+        self._link_up = True
+        self._connected = True
+
+    @property
+    def operation_lock(self):
+        # for callers which need several operations without another caller in between
+        return self._operation_lock
+
+    @property
+    def link_up(self):
+        return self._link_up
+
+    @property
+    def reconnects(self):
+        return self._reconnects
+
+    @property
+    def reconnect_time(self):
+        return self._reconnect_time
+
+    def link_lost(self, exc):
+        # called by the drivers on a transport error; the session is opened again by reconnect()
+        # returns True if the link is lost, False if the error keeps the session (e.g. a timeout of one query)
+        if not is_link_loss(exc):
+            logger.warning('%s: transfer failed (%s)', self._name, exc)
+            return False
+        with self._reconnect_lock:
+            if not self._link_up:
+                return True
+            self._link_up = False
+            self._link_lost_time = time.perf_counter()
+            self._next_reconnect = self._link_lost_time
+            self._reconnect_delay = self.RECONNECT_DELAY_MIN
+            self._reconnect_attempts = 0
+        logger.warning('%s: link lost (%s), reconnecting', self._name, exc)
+        return True
+
+    def reconnect(self):
+        # one attempt to open the session again and restore the configuration if it is due (bounded exponential
+        # backoff); returns True if the link is up
+        with self._reconnect_lock:
+            if self._link_up:
+                return True
+            if time.perf_counter() < self._next_reconnect:
+                return False
+            self._reconnect_attempts += 1
+            try:
+                if VisaSessionPool.instance().reopen(self._resource_id, self._inst.resource) is None:
+                    return False    # disconnected meanwhile, nothing to reconnect
+                self.restore_configuration()
+            except transport_errors() as exc:
+                self._next_reconnect = time.perf_counter() + self._reconnect_delay
+                self._reconnect_delay = min(2 * self._reconnect_delay, self.RECONNECT_DELAY_MAX)
+                logger.debug('%s: reconnect attempt %d failed (%s)', self._name, self._reconnect_attempts, exc)
+                return False
+            self._link_up = True
+            self._reconnects += 1
+            self._reconnect_time = time.perf_counter() - self._link_lost_time
+        logger.info('%s: link restored after %.1f ms (%d attempts)', self._name, self._reconnect_time * 1000,
+                    self._reconnect_attempts)
+        return True
+
+    def wait_for_reconnect(self, timeout):
+        # blocking reconnect, True if the link is up within the timeout
+        time_end = time.perf_counter() + timeout
+        while not self.reconnect():
+            delay = min(self._next_reconnect, time_end) - time.perf_counter()
+            if delay <= 0 and time.perf_counter() >= time_end:
+                return False
+            time.sleep(max(delay, 0.0))
+        return True
 
-    def connect(self, visa_resource_id):
-        rm = pyvisa.ResourceManager('@py')    # Linux version
-        # rm = pyvisa.ResourceManager('')
-        # list = rm.list_resources()
-        # print(list)
-        # connect to a specific instrument
-        self._inst = rm.open_resource(visa_resource_id, timeout=1000, resource_pyclass=pyvisa.resources.USBInstrument)
-        self._connected = True
\ No newline at end of file
+    def restore_configuration(self):
+        # the instrument may have been reset while the link was down: the drivers send their last known
+        # configuration again
+        pass
@@ -0,0 +1,95 @@
+import threading
+import time
+import numpy as np
+
+
+# per-phase timing of a control loop; durations of the last "window" cycles are kept for every phase
+# the loop calls begin_cycle(), mark(phase) at the end of every phase and end_cycle(); when disabled the calls
+# return immediately
+class LoopProfiler(object):
+    def __init__(self, phases, idle_phase=None, window=1000):
+        self._phases = tuple(phases)
+        self._index = {phase: i for i, phase in enumerate(self._phases)}
+        self._idle_phase = idle_phase   # waiting for the next cycle, not counted as busy time
+        self._window = window
+        self._enabled = False
+        self._lock = threading.Lock()
+        self._durations = np.zeros((window, len(self._phases) + 1))  # phases and busy time of the cycle
+        self._current = np.zeros(len(self._phases) + 1)
+        self._count = 0     # number of profiled cycles
+        self._overruns = 0  # cycles with busy time longer than the period
+        self._time_mark = 0.0
+
+    @property
+    def phases(self):
+        return self._phases
+
+    @property
+    def enabled(self):
+        return self._enabled
+
+    @enabled.setter
+    def enabled(self, value):
+        self._enabled = bool(value)
+
+    @property
+    def cycles(self):
+        return self._count
+
+    @property
+    def overruns(self):
+        return self._overruns
+
+    def reset(self):
+        with self._lock:
+            self._count = 0
+            self._overruns = 0
+
+    def begin_cycle(self):
+        if not self._enabled:
+            return
+        self._current[:] = 0.0
+        self._time_mark = time.perf_counter()
+
+    def mark(self, phase):
+        # time since the previous mark is added to the phase (a phase can occur several times in one cycle)
+        if not self._enabled:
+            return
+        time_mark = time.perf_counter()
+        self._current[self._index[phase]] += time_mark - self._time_mark
+        self._time_mark = time_mark
+
+    def end_cycle(self, period):
+        if not self._enabled:
+            return
+        busy = self._current[:-1].sum()
+        if self._idle_phase is not None:
+            busy -= self._current[self._index[self._idle_phase]]
+        self._current[-1] = busy
+        with self._lock:
+            self._durations[self._count % self._window] = self._current
+            self._count += 1
+            if busy > period:
+                self._overruns += 1
+
+    def __samples(self):
+        with self._lock:
+            return self._durations[:min(self._count, self._window)].copy()
+
+    def summary(self):
+        # p50, p99 and max of every phase and of the busy time ('cycle') in seconds over the window
+        samples = self.__samples()
+        result = {'cycles': self._count, 'overruns': self._overruns}
+        for i, phase in enumerate(self._phases + ('cycle',)):
+            if len(samples) == 0:
+                result[phase] = {'p50': 0.0, 'p99': 0.0, 'max': 0.0}
+            else:
+                p50, p99 = np.percentile(samples[:, i], (50, 99))
+                result[phase] = {'p50': float(p50), 'p99': float(p99), 'max': float(samples[:, i].max())}
+        return result
+
+    def histogram(self, phase, bins=20):
+        # histogram of the durations of the phase ('cycle' for the busy time) over the window, (counts, edges)
+        samples = self.__samples()
+        column = len(self._phases) if phase == 'cycle' else self._index[phase]
+        return np.histogram(samples[:, column], bins=bins)
@@ -0,0 +1,74 @@
+import time
+
+
+# fixed-rate scheduler running cycles against absolute monotonic deadlines
+class DeadlineScheduler:
+    def __init__(self, frequency):
+        self._period = 0.1
+        self.frequency = frequency  # trigger setter function
+        self._time_start = 0.0
+        self._deadline = 0.0
+        self._cycles = 0    # number of finished cycles
+        self._overruns = 0  # number of cycles which did not fit into the period
+        self._jitter = 0.0  # delay of the last wake up after its deadline in seconds
+        self._max_jitter = 0.0
+
+    @property
+    def frequency(self):
+        return 1 / self._period
+
+    @frequency.setter
+    def frequency(self, value):
+        try:
+            float_value = float(value)
+        except ValueError:
+            raise ValueError('Loop frequency must be a number')
+        if float_value <= 0:
+            raise ValueError('Loop frequency must be higher than 0 Hz')
+        self._period = 1 / float_value
+
+    @property
+    def period(self):
+        return self._period
+
+    @property
+    def cycles(self):
+        return self._cycles
+
+    @property
+    def overruns(self):
+        return self._overruns
+
+    @property
+    def jitter(self):
+        return self._jitter
+
+    @property
+    def max_jitter(self):
+        return self._max_jitter
+
+    def start(self):
+        self._time_start = time.monotonic()
+        self._deadline = self._time_start + self._period
+        self._cycles = 0
+        self._overruns = 0
+        self._jitter = 0.0
+        self._max_jitter = 0.0
+
+    def elapsed(self):
+        # time since the start of the loop in seconds
+        return time.monotonic() - self._time_start
+
+    def wait(self):
+        # wait for the end of the actual period; I/O and compute time of the cycle is already subtracted
+        self._cycles += 1
+        now = time.monotonic()
+        if now > self._deadline:   # cycle took longer than the period
+            self._overruns += 1
+            self._jitter = now - self._deadline
+            self._deadline = now + self._period     # skip the missed deadlines, do not try to catch up
+        else:
+            time.sleep(self._deadline - now)
+            self._jitter = time.monotonic() - self._deadline
+            self._deadline += self._period
+        self._max_jitter = max(self._max_jitter, self._jitter)
@@ -1,9 +1,19 @@
+from startup import StartupTimer
+startup_timer = StartupTimer()   # started before the imports
+import sys
+import logging
 import tkinter as tk
 from tkinter import ttk
 from sys import platform as _platform
+startup_timer.mark('import tkinter')
 from HuPulser_gui import HuPulserGui
+startup_timer.mark('import GUI and drivers')
 
 if __name__ == "__main__":
+    # with --startup-profile the durations of the startup phases are logged and the program is closed when the
+    # plots are shown (the config is not saved)
+    startup_profile = '--startup-profile' in sys.argv[1:]
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s %(name)s %(levelname)s: %(message)s')
     root = tk.Tk()
     # connect to a specific instrument
     # tk.Style().configure("TButton", padding=6, relief="flat", background="#ccc")
@@ -18,8 +28,11 @@ if __name__ == "__main__":
         s.theme_use("clam")
     elif _platform == "darwin":
         s.theme_use("aqua")
+    startup_timer.mark('Tk root')
 
     # root.configure(bg='#f5f5f5')
-    app = HuPulserGui(root)
+    app = HuPulserGui(root, startup_timer if startup_profile else None)
     root.protocol("WM_DELETE_WINDOW", app.on_closing)
+    if startup_profile:
+        root.bind('<<StartupFinished>>', lambda event: app.shutdown())
     root.mainloop()
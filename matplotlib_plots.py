@@ -1,9 +1,10 @@
 from matplotlib.backends.backend_tkagg import (FigureCanvasTkAgg)
 from matplotlib.figure import Figure
 import matplotlib.ticker as ticker
-import configparser
+import numpy as np
 from tkinter import messagebox
-import os
+import time as time_module
+from hupulser_config import load_config
 
 
 # class for plotting the entered data using Matplotlib
@@ -15,22 +16,36 @@ class MatplotlibPlotBase:
         self.canvas = FigureCanvasTkAgg(self._f, master=master)  # set the canvas
         self.canvas.get_tk_widget().pack()  # position the canvas in GUI
 
+    @property
+    def figure(self):
+        return self._f
+
 
 class MatplotlibPlot1axes(MatplotlibPlotBase):
     def __init__(self, master):     # initialization
         super().__init__(master, size_x=4, size_y=2.5)
         self._ax = self._f.add_axes([0.12, 0.2, 0.8, 0.75])             # add axes
-
-    def plot_waveforms(self, t, wf1, wf2, ch2_state, period, scale):
-        self._ax.clear()  # clear the previous plot
-        self.set_x_lim(period, scale)  # set x limits taking into account the current scale value
+        # axes and lines are created only once
         self._ax.set_xlabel('Time [$\\mathrm{\\mu s}$]')  # set x label
         self._ax.set_ylabel('Amplitude')  # set y label
-        self._ax.plot(t, wf1, color='red')  # plot the wave form of the negative pulse using a red color
-        if ch2_state:  # when CH2 is enabled
-            self._ax.plot(t, wf2, color='blue')  # plot the wave form of the positive pulse using a blue color
+        self._line_ch1, = self._ax.plot([], [], color='red')  # wave form of the negative pulse using a red color
+        self._line_ch2, = self._ax.plot([], [], color='blue')  # wave form of the positive pulse using a blue color
         self._ax.set_ylim(-0.2, 1.2)
         self._ax.set_yticks([0, 1])
+
+    # only the vertices around the edges are needed to draw a 0/1 waveform (a few points per pulse)
+    @staticmethod
+    def waveform_edges(t, wf):
+        change = np.flatnonzero(np.diff(wf))  # wf changes between change and change + 1
+        keep = np.unique(np.concatenate(([0], change, change + 1, [len(wf) - 1])))
+        return t[keep], wf[keep]
+
+    def plot_waveforms(self, t, wf1, wf2, ch2_state, period, scale):
+        self._line_ch1.set_data(*self.waveform_edges(t, wf1))
+        if ch2_state:  # when CH2 is enabled
+            self._line_ch2.set_data(*self.waveform_edges(t, wf2))
+        self._line_ch2.set_visible(ch2_state)
+        self.set_x_lim(period, scale)  # set x limits taking into account the current scale value
         self.canvas.draw()  # show the canvas at the screen
 
     def set_x_lim(self, period, scale):
@@ -38,24 +53,79 @@ class MatplotlibPlot1axes(MatplotlibPlotBase):
         x_offset = max_value/10
         self._ax.set_xlim(-x_offset, period/100*scale + x_offset)
 
+    # change of the scale; only the figure background and the axes are redrawn and blitted
+    def update_x_lim(self, period, scale):
+        self.set_x_lim(period, scale)
+        self._f.draw_artist(self._f.patch)
+        self._f.draw_artist(self._ax)
+        self.canvas.blit(self._f.bbox)
+
 
+# plot of one power supply, y limits are configured by the ini section "<section> - plot" of config (the parsed
+# ini file of the application, read from the file when not given)
 class MatplotlibPlot3axes(MatplotlibPlotBase):
-    def __init__(self, master):  # initialization
+    def __init__(self, master, section='DC1', config=None):  # initialization
         super().__init__(master, size_x=5, size_y=2.5)
         self._ax1 = self._f.add_axes([0.125, 0.2, 0.615, 0.75])  # add axes
         self._ax2 = self._ax1.twinx()
         self._ax3 = self._ax1.twinx()
         self._y_max_values = [0.0, 0.0, 0.0]  # (Ax1, Ax2, Ax3)
-        self.config = configparser.ConfigParser()
-        # self._config.read('hupulser.ini') # Linux version
-        config_path = os.path.join(os.path.dirname(__file__), 'hupulser.ini')
-        self.config.read(config_path)
+        self._layout_changed = True     # static background (limits, ticks) must be redrawn
+        self._history = False   # history (True) or realtime (False) x axis
+        self._frame_time = 0.0  # average duration of one frame in seconds
+        self._full_redraws = 0  # number of frames with redraw of the static background
+        self.config = load_config() if config is None else config
         try:
-            self.set_y_max_values(0, self.config['DC1 - plot']['max_voltage'])
-            self.set_y_max_values(1, self.config['DC1 - plot']['max_power'])
-            self.set_y_max_values(2, self.config['DC1 - plot']['max_current'])
+            self.set_y_max_values(0, self.config[section + ' - plot']['max_voltage'])
+            self.set_y_max_values(1, self.config[section + ' - plot']['max_power'])
+            self.set_y_max_values(2, self.config[section + ' - plot']['max_current'])
         except KeyError:  # key Pulser not found in config (no config present)
             messagebox.showinfo('Info', 'Max values for plots were not found in ini file.')
+        self.__build_axes()
+
+    # axes, labels, spines and lines are created only once, frames only update the data of the lines
+    def __build_axes(self):
+        self.make_patch_spines_invisible(self._ax2)
+        self._ax2.spines["right"].set_visible(True)
+
+        self._ax1.set_xlabel('Time (s)')  # set x label
+        self._ax1.set_ylabel('Voltage (V)')  # set y label
+        self._ax2.set_ylabel('Power (W)')  # set y label
+        self._ax3.set_ylabel('Current (mA)')  # set y label
+        # lines are animated, they are not part of the static background used for blitting
+        self._line_voltage, = self._ax1.plot([], [], color='blue', animated=True)
+        self._line_voltage_ps, = self._ax1.plot([], [], color='blue', linestyle="dashed", animated=True)
+        self._line_power, = self._ax2.plot([], [], color='black', animated=True)
+        self._line_power_ps, = self._ax2.plot([], [], color='black', linestyle="dashed", animated=True)
+        self._line_current, = self._ax3.plot([], [], color='red', animated=True)
+        self._ax1.yaxis.label.set_color('blue')
+        self._ax2.yaxis.label.set_color('black')
+        self._ax3.yaxis.label.set_color('red')
+        self._ax3.spines['right'].set_position(('outward', 45))  # Move Target current axis to right
+
+        self._ax1.tick_params(axis='y', colors='blue')
+        self._ax1.tick_params(which='minor', axis='y', colors='blue')
+        self._ax2.tick_params(axis='y', colors='black')
+        self._ax2.tick_params(which='minor', axis='y', colors='black')
+        self._ax3.tick_params(axis='y', colors='red')
+        self._ax3.tick_params(which='minor', axis='y', colors='red')
+        self._ax1.tick_params(axis='x')
+
+        self._ax2.set_zorder(2)  # default zorder is 0 for ax1 and ax2
+        self._ax2.patch.set_visible(False)  # prevents ax1 from hiding ax2
+        self._ax1.set_zorder(1)  # default zorder is 0 for ax1 and ax2
+        self._ax1.patch.set_visible(False)  # prevents ax1 from hiding ax2
+        self._ax1.xaxis.set_major_locator(ticker.MultipleLocator(1))
+        self._ax1.xaxis.set_minor_locator(ticker.MultipleLocator(0.5))
+        self._ax1.set_xlim(0, 1)
+
+    @property
+    def frame_time(self):
+        return self._frame_time
+
+    @property
+    def full_redraws(self):
+        return self._full_redraws
 
     @property
     def y_max_values(self):
@@ -76,50 +146,58 @@ class MatplotlibPlot3axes(MatplotlibPlotBase):
             raise ValueError('Max value for each axes must be than 2000')
         else:
             self._y_max_values[int_ax_number] = float_value
+            self._layout_changed = True     # new y limits are set with the next frame
 
+    # update of the realtime plot, returns the changed artists for blitting (FuncAnimation with blit=True)
     def plot_waveforms_realtime(self, iter_number, time, voltage, power, current, voltage_ps, power_ps):
-        self._ax1.clear()  # clear the previous plot
-        self._ax2.clear()  # clear the previous plot
-        self._ax3.clear()  # clear the previous plot
-        self.make_patch_spines_invisible(self._ax2)
-        self._ax2.spines["right"].set_visible(True)
-
-        self._ax1.set_xlabel('Time (s)')  # set x label
-        self._ax1.set_ylabel('Voltage (V)')  # set y label
-        self._ax2.set_ylabel('Power (W)')  # set y label
-        self._ax3.set_ylabel('Current (mA)')  # set y label
-        p1, = self._ax1.plot(time, voltage,
-                                color='blue')  # plot the wave form of the negative pulse using a red color
-        p1, = self._ax1.plot(time, voltage_ps, color='blue',
-                                linestyle="dashed")  # plot the wave form of the negative pulse using a red color
-        p2, = self._ax2.plot(time, power,
-                                color='black')  # plot the wave form of the negative pulse using a red color
-        p2, = self._ax2.plot(time, power_ps, color='black', linestyle="dashed")
-        p3, = self._ax3.plot(time, current,
-                                color='red')  # plot the wave form of the negative pulse using a red color
-        self._ax1.yaxis.label.set_color(p1.get_color())
-        self._ax2.yaxis.label.set_color(p2.get_color())
-        self._ax3.yaxis.label.set_color(p3.get_color())
-        self._ax3.spines['right'].set_position(('outward', 45))  # Move Target current axis to right
-
-        self._ax1.tick_params(axis='y', colors=p1.get_color())
-        self._ax1.tick_params(which='minor', axis='y', colors=p1.get_color())
-        self._ax2.tick_params(axis='y', colors=p2.get_color())
-        self._ax2.tick_params(which='minor', axis='y', colors=p2.get_color())
-        self._ax3.tick_params(axis='y', colors=p3.get_color())
-        self._ax3.tick_params(which='minor', axis='y', colors=p3.get_color())
-        self._ax1.tick_params(axis='x')
-
-        self._ax2.set_zorder(2)  # default zorder is 0 for ax1 and ax2
-        self._ax2.patch.set_visible(False)  # prevents ax1 from hiding ax2
-        self._ax1.set_zorder(1)  # default zorder is 0 for ax1 and ax2
-        self._ax1.patch.set_visible(False)  # prevents ax1 from hiding ax2
-
-        self._ax1.set_ylim(0, self._y_max_values[0])
-        self._ax2.set_ylim(0, self._y_max_values[1])
-        self._ax3.set_ylim(0, self._y_max_values[2])
-        self._ax1.xaxis.set_major_locator(ticker.MultipleLocator(1))
-        self._ax1.xaxis.set_minor_locator(ticker.MultipleLocator(0.5))
+        time_start = time_module.perf_counter()
+        if self._history:
+            self._history = False
+            self._ax1.xaxis.set_major_locator(ticker.MultipleLocator(1))
+            self._ax1.xaxis.set_minor_locator(ticker.MultipleLocator(0.5))
+            self._layout_changed = True
+        # x limits move in steps (25 % of the time span) so that most frames need only the blit
+        x_min, x_max = self._ax1.get_xlim()
+        span = time[-1] - time[0]
+        if span <= 0:
+            if (x_min, x_max) != (0, 1):
+                self._ax1.set_xlim(0, 1)
+                self._layout_changed = True
+        elif time[0] < x_min or time[-1] > x_max or x_max - x_min > 2 * span:
+            self._ax1.set_xlim(time[0], time[0] + 1.25 * span)
+            self._layout_changed = True
+        return self.__update_lines(time_start, time, voltage, power, current, voltage_ps, power_ps)
+
+    # update of the decimated history plot, x limits are given by the shown window
+    def plot_waveforms_history(self, iter_number, time, voltage, power, current, voltage_ps, power_ps):
+        time_start = time_module.perf_counter()
+        if not self._history:
+            self._history = True
+            self._ax1.xaxis.set_major_locator(ticker.AutoLocator())
+            self._ax1.xaxis.set_minor_locator(ticker.AutoMinorLocator())
+            self._layout_changed = True
+        if len(time) > 1 and (time[0], time[-1]) != tuple(self._ax1.get_xlim()):
+            self._ax1.set_xlim(time[0], time[-1])
+            self._layout_changed = True
+        return self.__update_lines(time_start, time, voltage, power, current, voltage_ps, power_ps)
+
+    def __update_lines(self, time_start, time, voltage, power, current, voltage_ps, power_ps):
+        self._line_voltage.set_data(time, voltage)
+        self._line_voltage_ps.set_data(time, voltage_ps)
+        self._line_power.set_data(time, power)
+        self._line_power_ps.set_data(time, power_ps)
+        self._line_current.set_data(time, current)
+        if self._layout_changed:    # redraw the static background, FuncAnimation caches it again
+            self._layout_changed = False
+            self._ax1.set_ylim(0, self._y_max_values[0])
+            self._ax2.set_ylim(0, self._y_max_values[1])
+            self._ax3.set_ylim(0, self._y_max_values[2])
+            self.canvas.draw()
+            self._full_redraws += 1
+        # exponential average of the frame time
+        self._frame_time = 0.9 * self._frame_time + 0.1 * (time_module.perf_counter() - time_start)
+        return (self._line_voltage, self._line_voltage_ps, self._line_power, self._line_power_ps,
+                self._line_current)
 
     def make_patch_spines_invisible(self, ax):
         ax.set_frame_on(True)
@@ -0,0 +1,336 @@
+import time
+import tkinter as tk
+from tkinter import messagebox
+import numpy as np
+import threading
+from custom_widgets import ToggleButton, Indicator
+from ITECH_IT6726V_power_supply import ItechIT6726VPowerSupply
+from power_supply_process import PowerSupplyProcess
+from telemetry import TelemetryStore
+
+
+# controls and plot of one power supply configured by the ini section "DCn"; the widgets of all modes are
+# generated from the templates below, every supply has its own driver, PID loop thread and telemetry store
+# the plot (matplotlib) is built by build_plot() after the window is shown, a placeholder is shown until then
+class PowerSupplyPanel:
+    MODES = (('Voltage', 'V'), ('Power', 'W'), ('Current', 'mA'))     # (name, unit) of mode 0, 1, 2
+    PLOT_AXES = (('Voltage', 'V', 'blue'), ('Power', 'W', 'black'), ('Current', 'mA', 'red'))
+    PID_COEFFICIENTS = ('P', 'I', 'D')
+    CONFIG_SETPOINTS = ('setpoint_voltage', 'setpoint_power', 'setpoint_current')
+    CONFIG_PID = (('p_voltage', 'i_voltage', 'd_voltage'), ('p_power', 'i_power', 'd_power'),
+                  ('p_current', 'i_current', 'd_current'))
+    CONFIG_PLOT = ('max_voltage', 'max_power', 'max_current')
+
+    def __init__(self, root, master, status_master, config, section):
+        self.root = root
+        self._config = config
+        self._section = section
+        if self._config.getboolean(section, 'control_process', fallback=False):
+            self._ps = PowerSupplyProcess(section, config)  # PID loop not affected by the GUI
+        else:
+            self._ps = ItechIT6726VPowerSupply(section, config=config)
+        try:
+            for mode, key in enumerate(self.CONFIG_SETPOINTS):
+                self._ps.set_setpoint_for_mode(mode, self._config[section][key])
+        except KeyError:
+            messagebox.showinfo('Info', 'Some config values for {} not found in ini file.'.format(section))
+
+        # status line of the supply (readback, loop timing)
+        self.status = tk.StringVar(None)
+        self.status_bar = tk.Label(status_master, textvariable=self.status, bd=1, relief=tk.SUNKEN, anchor=tk.W)
+        self.status_bar.pack(side=tk.BOTTOM, fill=tk.X)
+
+        # DC POWER SUPPLY FRAME
+        ps_frame = tk.LabelFrame(master, background=self.root['bg'], borderwidth=2, relief=tk.RIDGE,
+                                 text='  ITECH IT6726V - {}  '.format(section))
+        ps_frame.pack(side=tk.LEFT, fill=tk.Y, padx=2, pady=(5, 2))
+        ps_connect_frame = tk.Frame(ps_frame, background=self.root['bg'])
+        ps_connect_frame.pack()
+        self.button_connect = tk.Button(ps_connect_frame, text='Connect', command=self.connect, relief=tk.GROOVE)
+        self.button_connect.grid(row=0, column=0, padx=5, sticky='W')
+        self.indicator_connected = Indicator(ps_connect_frame, text='Connected')
+        self.indicator_connected.grid(row=0, column=1, columnspan=2, padx=5, sticky='E')
+        self.button_output = tk.Button(ps_connect_frame, text="DC ON/OFF", relief=tk.GROOVE,
+                                       command=self.toggle_output)
+        self.button_output.grid(row=1, column=0, columnspan=2, padx=5, pady=(10, 0), sticky='W')
+        self.indicator_output = Indicator(ps_connect_frame, 'DC ON')
+        self.indicator_output.grid(row=1, column=1, columnspan=2, padx=5, pady=(10, 0), sticky='E')
+
+        # VALUES: setpoint, live value and regime indicator of every mode
+        ps_values_frame = tk.Frame(ps_frame, background=self.root['bg'])
+        ps_values_frame.pack()
+        tk.Label(ps_values_frame, text='Limits').grid(row=0, column=1, padx=5, pady=(5, 0), sticky='E')
+        tk.Label(ps_values_frame, text='Live').grid(row=0, column=2, padx=5, pady=(5, 0), sticky='E')
+        self.entry_setpoints = []
+        self.label_live = []
+        self.indicator_regime = []
+        for mode, (name, unit) in enumerate(self.MODES):
+            row = mode + 1
+            tk.Label(ps_values_frame, text=name).grid(row=row, column=0, padx=5, pady=(5, 0), sticky='E')
+            entry = tk.Entry(ps_values_frame, width=6, justify=tk.RIGHT)
+            entry.insert(0, self._ps.setpoints[mode])
+            entry.bind("<Return>", lambda event, mode=mode, entry=entry: self.setpoint_confirmed(mode, entry))
+            entry.bind("<FocusOut>", lambda event, mode=mode, entry=entry: self.setpoint_focus_out(mode, entry))
+            entry.grid(row=row, column=1, padx=5, pady=(5, 0), sticky='E')
+            self.entry_setpoints.append(entry)
+            label_live = tk.Label(ps_values_frame, width=6, anchor='e', text='0', relief=tk.SUNKEN, bg='#f5f5f5',
+                                  bd=1, padx=0)
+            label_live.grid(row=row, column=2, padx=5, pady=(5, 0), sticky='E')
+            self.label_live.append(label_live)
+            tk.Label(ps_values_frame, text=unit).grid(row=row, column=3, padx=5, pady=(5, 0), sticky='W')
+            indicator = Indicator(ps_values_frame, '')
+            indicator.grid(row=row, column=4, padx=5, pady=(5, 0), sticky='E')
+            self.indicator_regime.append(indicator)
+
+        # PID coefficients of every mode
+        ps_pid = tk.Frame(ps_frame, background=self.root['bg'], pady=5)
+        ps_pid.pack()
+        self.entry_pid = []
+        for mode, (name, _) in enumerate(self.MODES):
+            row = 2 * mode
+            tk.Label(ps_pid, text=name + ' mode').grid(row=row, column=1, padx=2, pady=(5, 0), columnspan=6,
+                                                        sticky='W')
+            entries = []
+            for index, coefficient in enumerate(self.PID_COEFFICIENTS):
+                tk.Label(ps_pid, text=coefficient).grid(row=row + 1, column=2 * index, padx=2, pady=(5, 0),
+                                                        sticky='E')
+                entry = tk.Entry(ps_pid, width=6, justify=tk.RIGHT)
+                entry.insert(0, self._ps.get_pid_values(mode)[index])
+                entry.bind("<Return>", lambda event, mode=mode, index=index,
+                           entry=entry: self.pid_value_confirmed(mode, index, entry))
+                entry.bind("<FocusOut>", lambda event, mode=mode, index=index,
+                           entry=entry: self.pid_value_focus_out(mode, index, entry))
+                entry.grid(row=row + 1, column=2 * index + 1, padx=2, pady=(5, 0), sticky='E')
+                entries.append(entry)
+            self.entry_pid.append(entries)
+
+        # PS PLOT FRAME
+        ps_plot_frame = tk.LabelFrame(master, background=self.root['bg'], borderwidth=2, relief=tk.RIDGE,
+                                      text='  {} PLOT  '.format(section))
+        ps_plot_frame.pack(side=tk.LEFT, fill=tk.Y, padx=2, pady=(5, 2))
+        self._ps_plot_frame = ps_plot_frame
+        self._plot_placeholder = tk.Label(ps_plot_frame, text='Loading plot ...', background=self.root['bg'])
+        self._plot_placeholder.pack(padx=190, pady=150)    # about the size of the plot
+        self._m_plot = None
+        self._anim = None
+        self._plot_history_points = 1000   # max. number of points of the history plot
+
+    # plot, its limits and the history controls; matplotlib is imported here (usually already in background)
+    def build_plot(self):
+        from matplotlib.animation import FuncAnimation
+        from matplotlib_plots import MatplotlibPlot3axes
+        self._plot_placeholder.destroy()
+        ps_plot_frame = self._ps_plot_frame
+        self._m_plot = MatplotlibPlot3axes(ps_plot_frame, self._section, self._config)
+
+        # PS PLOT CONFIG: max. value of every y axis
+        ps_plot_config = tk.Frame(ps_plot_frame, background=self.root['bg'], pady=30)
+        ps_plot_config.pack()
+        self.entry_plot_max_limit = []
+        for ax, (name, unit, color) in enumerate(self.PLOT_AXES):
+            tk.Label(ps_plot_config, text=name, fg=color).grid(row=0, column=3 * ax, padx=5, sticky='E')
+            entry = tk.Entry(ps_plot_config, width=6, justify=tk.RIGHT)
+            entry.insert(0, self._m_plot.y_max_values[ax])
+            entry.bind("<Return>", lambda event, ax=ax, entry=entry: self.plot_y_setpoint_confirmed(ax, entry))
+            entry.bind("<FocusOut>", lambda event, ax=ax, entry=entry: self.plot_y_setpoint_focus_out(ax, entry))
+            entry.grid(row=0, column=3 * ax + 1, padx=5, sticky='E')
+            self.entry_plot_max_limit.append(entry)
+            tk.Label(ps_plot_config, text=unit, fg=color).grid(row=0, column=3 * ax + 2, padx=5, sticky='W')
+
+        # history of the whole run: window length (zoom) and position of the window end (scroll) in % of the run
+        self.toggleButton_plot_history = ToggleButton(ps_plot_config, text="History", ind_height=12)
+        self.toggleButton_plot_history.grid(row=1, column=0, columnspan=2, padx=5, pady=(10, 0), sticky='W')
+        label_plot_history_zoom = tk.Label(ps_plot_config, text='Zoom')
+        label_plot_history_zoom.grid(row=1, column=2, padx=5, pady=(10, 0), sticky='SE')
+        self.scale_plot_history_zoom = tk.Scale(ps_plot_config, orient=tk.HORIZONTAL, from_=1, to=100,
+                                                showvalue=False, background=self.root['bg'])
+        self.scale_plot_history_zoom.set(100)
+        self.scale_plot_history_zoom.grid(row=1, column=3, columnspan=2, padx=5, pady=(10, 0), sticky='W')
+        label_plot_history_position = tk.Label(ps_plot_config, text='Position')
+        label_plot_history_position.grid(row=1, column=5, padx=5, pady=(10, 0), sticky='SE')
+        self.scale_plot_history_position = tk.Scale(ps_plot_config, orient=tk.HORIZONTAL, from_=0, to=100,
+                                                    showvalue=False, background=self.root['bg'])
+        self.scale_plot_history_position.set(100)
+        self.scale_plot_history_position.grid(row=1, column=6, columnspan=3, padx=5, pady=(10, 0), sticky='W')
+        # only the lines are redrawn in every frame (blitting), static background only after a layout change
+        self._anim = FuncAnimation(self._m_plot.figure, self.plot_update, frames=10, interval=100, blit=True)
+
+    @property
+    def ps(self):
+        return self._ps
+
+    @property
+    def section(self):
+        return self._section
+
+    # connect or disconnect the power supply
+    def connect(self):
+        if not self._ps.connected:
+            try:
+                self._ps.connect(self._config[self._section]['resource_id'], self._section)
+            except Exception as e:
+                messagebox.showerror('Error', 'Connection to IT6726V ({}) failed\n\n'.format(self._section) + str(e))
+            finally:
+                self.indicator_connected.on = self._ps.connected
+                self._ps.inst.write("*CLS")     # clean the PS register
+                self._ps.inst.write("*RST")     # set the PS default settings
+        else:
+            self.stop()
+            self._ps.disconnect()
+            self.indicator_output.on = self._ps.status['outputON']
+            self.indicator_connected.on = self._ps.connected
+            # turn off the corresponding indicators
+            for indicator in self.indicator_regime:
+                indicator.on = False
+
+    # periodic update of U, P, I values in GUI; running in a thread
+    def periodic_update(self):
+        while self._ps.output:
+            # take the last row of the telemetry (all values from the same cycle)
+            row = self._ps.telemetry.latest()
+            self.label_live[0].config(text=str(round(row[TelemetryStore.VOLTAGE_CALC])))
+            self.label_live[1].config(text=str(round(row[TelemetryStore.POWER_PS])))
+            self.label_live[2].config(text=str(round(row[TelemetryStore.CURRENT_PS])))
+            # activate the corresponding indicator based on the actual mode
+            for mode, indicator in enumerate(self.indicator_regime):
+                indicator.on = self._ps.mode == mode
+            # show the duration of the U, P, I readback from the PS
+            scheduler = self._ps.scheduler
+            telemetry_lane = self._ps.inst.statistics()['telemetry']
+            status = ('{} readback: {:.1f} ms ({}, queue wait {:.1f} ms), loop {:.1f} Hz, jitter {:.1f} ms '
+                      '(max {:.1f} ms), overruns {:d}/{:d}'.format(self._section,
+                      self._ps.read_round_trip_time * 1000,
+                      'combined query' if self._ps.combined_query_enabled else 'individual queries',
+                      telemetry_lane['wait_time'] * 1000, scheduler.frequency, scheduler.jitter * 1000,
+                      scheduler.max_jitter * 1000, scheduler.overruns, scheduler.cycles))
+            if not self._ps.link_up:
+                status += ' | LINK LOST, output held, reconnecting'
+            elif self._ps.reconnects:
+                status += ' | reconnects {:d}, last {:.0f} ms'.format(self._ps.reconnects,
+                                                                     self._ps.reconnect_time * 1000)
+            if self._ps.profiler.enabled:  # p50/p99 of the phases of the PID cycle
+                summary = self._ps.profiler.summary()
+                status += ' | ' + ', '.join('{} {:.1f}/{:.1f}'.format(phase, summary[phase]['p50'] * 1000,
+                                                                      summary[phase]['p99'] * 1000)
+                                            for phase in ('read', 'compute', 'write', 'buffers', 'cycle'))
+                status += ' ms (p50/p99), max cycle {:.1f} ms, busy overruns {:d}'.format(
+                    summary['cycle']['max'] * 1000, summary['overruns'])
+            self.status.set(status)
+            time.sleep(0.2)
+
+    # animation callback; one consistent telemetry snapshot is taken for every frame
+    def plot_update(self, iter_number):
+        if self.toggleButton_plot_history.on:
+            return self.plot_history_update(iter_number)
+        rows = self._ps.telemetry.snapshot()
+        return self._m_plot.plot_waveforms_realtime(iter_number, rows[:, TelemetryStore.TIME],
+                                                    rows[:, TelemetryStore.VOLTAGE_CALC],
+                                                    rows[:, TelemetryStore.POWER_PS],
+                                                    rows[:, TelemetryStore.CURRENT_PS],
+                                                    rows[:, TelemetryStore.VOLTAGE_PS],
+                                                    rows[:, TelemetryStore.POWER_PS])
+
+    # plot of the decimated history; the number of points is bounded for any window length
+    def plot_history_update(self, iter_number):
+        time_first, time_last = self._ps.history.time_range()
+        run_length = time_last - time_first
+        window = max(run_length * self.scale_plot_history_zoom.get() / 100, 1.0)   # at least 1 s
+        time_to = time_first + window + max(run_length - window, 0) * self.scale_plot_history_position.get() / 100
+        t, values = self._ps.history.get_window(time_to - window, time_to, self._plot_history_points)
+        return self._m_plot.plot_waveforms_history(iter_number, t, values[:, 0], values[:, 2], values[:, 3],
+                                                   values[:, 1], values[:, 2])
+
+    def setpoint_focus_out(self, mode, entry):
+        float_new_value = 0.0
+        try:
+            float_new_value = float(entry.get())
+        except ValueError as e:
+            messagebox.showerror('Error', str(e))
+            entry.config(fg='red')
+        if not np.isclose(float_new_value, float(self._ps.setpoints[mode])):
+            entry.config(fg='red')
+        else:
+            entry.config(fg='black')
+
+    def setpoint_confirmed(self, mode, entry):
+        try:
+            new_value = entry.get()
+            self._ps.set_setpoint_for_mode(mode, new_value)
+            entry.config(fg='black')
+        except ValueError as e:
+            messagebox.showerror('Error', str(e))
+
+    def pid_value_confirmed(self, pid_values, index, entry):
+        try:
+            new_value = entry.get()
+            self._ps.set_pid_values(pid_values, index, new_value)
+            entry.config(fg='black')
+        except ValueError as e:
+            messagebox.showerror('Error', str(e))
+
+    def pid_value_focus_out(self, mode, index, entry):
+        float_new_value = 0.0
+        try:
+            float_new_value = float(entry.get())
+        except ValueError as e:
+            messagebox.showerror('Error', str(e))
+            entry.config(fg='red')
+        if not np.isclose(float_new_value, float(self._ps.get_pid_values(mode)[index])):
+            entry.config(fg='red')
+        else:
+            entry.config(fg='black')
+
+    def toggle_output(self):
+        self._ps.output = not self._ps.output
+        self.indicator_output.on = self._ps.status['outputON']
+        if not self._ps.output:
+            self._ps.mode = 1  # initial mode is Power mode
+            for indicator in self.indicator_regime:
+                indicator.on = False
+        if self._ps.output:     # buffers are cleared by the PID loop before its first cycle
+            threading.Thread(target=self.periodic_update).start()
+
+    def plot_y_setpoint_confirmed(self, ax_number, entry):
+        # new max y value for axis in PS plot
+        try:
+            new_value = entry.get()
+            self._m_plot.set_y_max_values(ax_number, new_value)
+            entry.config(fg='black')
+        except ValueError as e:
+            messagebox.showerror('Error', str(e))
+
+    def plot_y_setpoint_focus_out(self, ax_number, entry):
+        float_new_value = 0.0
+        try:
+            float_new_value = float(entry.get())
+        except ValueError as e:
+            messagebox.showerror('Error', str(e))
+            entry.config(fg='red')
+        if not np.isclose(float_new_value, float(self._m_plot.y_max_values[ax_number])):
+            entry.config(fg='red')
+        else:
+            entry.config(fg='black')
+
+    def stop(self):
+        self._ps.output = False
+
+    # stop the output and release the driver (and its control process)
+    def close(self):
+        if self._anim is not None:
+            self._anim.event_source.stop()
+        self._ps.close()
+
+    # keep setpoints, PID values and plot limits in the config
+    def save_config(self):
+        for mode, key in enumerate(self.CONFIG_SETPOINTS):
+            self._config.set(self._section, key, str(self._ps.setpoints[mode]))
+        for mode, keys in enumerate(self.CONFIG_PID):
+            for index, key in enumerate(keys):
+                self._config.set(self._section, key, str(self._ps.get_pid_values(mode)[index]))
+        if self._m_plot is None:    # plot not built, limits in the config are unchanged
+            return
+        plot_section = self._section + ' - plot'
+        if not self._config.has_section(plot_section):
+            self._config.add_section(plot_section)
+        for ax, key in enumerate(self.CONFIG_PLOT):
+            self._config.set(plot_section, key, str(self._m_plot.y_max_values[ax]))
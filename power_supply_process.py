@@ -0,0 +1,141 @@
+import multiprocessing
+import threading
+import numpy as np
+from telemetry import TelemetryStore
+
+
+# requests of the control channel
+_GET = 'get'    # value of an attribute (dotted path, e.g. 'scheduler.jitter')
+_SET = 'set'
+_CALL = 'call'
+_STOP = 'stop'
+_CALLABLE = '<callable>'    # answer to _GET of a method
+_OBJECT = '<object>'    # answer to _GET of an object which is not sent as a value (scheduler, inst, ...)
+_VALUE_TYPES = (bool, int, float, str, list, tuple, dict, np.ndarray, np.generic)
+
+
+# body of the child process: hosts the power supply driver and its PID loop thread, serves the control channel
+def _serve(connection, section, config):
+    from ITECH_IT6726V_power_supply import ItechIT6726VPowerSupply
+    ps = ItechIT6726VPowerSupply(section, shared_telemetry=True, config=config)
+    connection.send((ps.telemetry.shared_memory_name, ps.telemetry.size))
+    while True:
+        request, path, args = connection.recv()
+        if request == _STOP:
+            ps.close()
+            connection.send((True, None))
+            return
+        try:
+            obj = ps
+            names = path.split('.')
+            for name in names[:-1]:
+                obj = getattr(obj, name)
+            if request == _GET:
+                value = getattr(obj, names[-1])
+                if callable(value):
+                    result = _CALLABLE
+                elif value is None or isinstance(value, _VALUE_TYPES):
+                    result = value
+                else:
+                    result = _OBJECT
+            elif request == _SET:
+                result = setattr(obj, names[-1], args[0])
+            else:
+                result = getattr(obj, names[-1])(*args)
+            connection.send((True, result))
+        except Exception as exc:
+            try:
+                connection.send((False, exc))
+            except Exception:   # exception which cannot be pickled
+                connection.send((False, RuntimeError(repr(exc))))
+
+
+# attribute of the driver in the child process; reading returns values, methods are called remotely
+class _RemoteObject(object):
+    def __init__(self, process, path):
+        object.__setattr__(self, '_process', process)
+        object.__setattr__(self, '_path', path)
+
+    def __getattr__(self, name):
+        return self._process.remote_get(self._path + '.' + name)
+
+    def __setattr__(self, name, value):
+        self._process.request(_SET, self._path + '.' + name, value)
+
+
+# power supply whose PID loop runs in a dedicated child process, so that the loop timing is not affected by the
+# GUI (GIL held by Tk and matplotlib); same interface as ItechIT6726VPowerSupply
+# the telemetry is read from shared memory without copying, everything else goes over the control channel
+# (a pipe; one request at a time); the parsed config is sent to the child, the ini file is not read again
+class PowerSupplyProcess(object):
+    def __init__(self, section='DC1', config=None):
+        context = multiprocessing.get_context('spawn')  # no copy of the Tk process state
+        self._connection, child_connection = context.Pipe()
+        self._lock = threading.Lock()
+        self._section = section
+        self._closed = False
+        self._process = context.Process(target=_serve, args=(child_connection, section, config),
+                                        name=section + '-control', daemon=True)
+        self._process.start()
+        shared_memory_name, size = self._connection.recv()
+        self._telemetry = TelemetryStore(size, shared_memory_name)
+
+    def request(self, request, path, *args):
+        with self._lock:
+            if self._closed:
+                raise RuntimeError('Control process of {} is stopped'.format(self._section))
+            self._connection.send((request, path, args))
+            ok, result = self._connection.recv()
+            if request == _STOP:
+                self._closed = True
+        if not ok:
+            raise result
+        return result
+
+    def remote_get(self, path):
+        value = self.request(_GET, path)
+        if isinstance(value, str) and value == _CALLABLE:
+            return lambda *args: self.request(_CALL, path, *args)
+        if isinstance(value, str) and value == _OBJECT:
+            return _RemoteObject(self, path)
+        return value
+
+    def __getattr__(self, name):
+        # attributes and methods not defined here are taken from the driver in the child process
+        if name.startswith('_'):
+            raise AttributeError(name)
+        return self.remote_get(name)
+
+    @property
+    def section(self):
+        return self._section
+
+    @property
+    def telemetry(self):
+        return self._telemetry
+
+    @property
+    def output(self):
+        try:
+            return self.request(_GET, 'output')
+        except RuntimeError:    # control process stopped, no output
+            return False
+
+    @output.setter
+    def output(self, value):
+        self.request(_SET, 'output', value)
+
+    @property
+    def mode(self):
+        return self.request(_GET, 'mode')
+
+    @mode.setter
+    def mode(self, value):
+        self.request(_SET, 'mode', value)
+
+    def close(self):
+        # stop the output and the child process
+        if not self._closed and self._process.is_alive():
+            self.request(_STOP, '')
+            self._process.join()
+        self._telemetry.close()
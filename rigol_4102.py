@@ -1,12 +1,22 @@
 import numpy as np
-from math import ceil
-import pyvisa
 import time as time_module
-from instrument import Instrument
+import threading
+import collections
+import logging
+from instrument import Instrument, visa_io_error, reconnecting, exclusive
+from command_queue import InstrumentCommandQueue
+from waveform_cache import WaveformCache, WaveformEntry
+
+
+logger = logging.getLogger(__name__)
+
+
+# pulse shape compiled for a given frequency: segment lengths in waveform steps and their polarities
+CompiledPulseShape = collections.namedtuple('CompiledPulseShape', ['lengths', 'polarities'])
 
 
 class RigolDG4102Pulser(Instrument):
-    def __init__(self):
+    def __init__(self, waveform_cache_size=16 * 1024 * 1024):
         super().__init__()
         self._num_wf_points = 16384
         self._amplitude = 3.7  # both channels have fixed amplitude 3.7 V
@@ -19,16 +29,32 @@ class RigolDG4102Pulser(Instrument):
         self._pulse_shape = []
         self._ch1_waveform = np.zeros(self._num_wf_points, dtype=int)
         self._ch2_waveform = np.zeros(self._num_wf_points, dtype=int)
+        self._ch1_encoded = b''     # upload-ready (binary DAC) encoding of the channel waveforms
+        self._ch2_encoded = b''
+        # parsed waveforms and their encodings for recently used shapes and frequencies (size in bytes)
+        self._waveform_cache = WaveformCache(waveform_cache_size)
         self.pulse_shape = ['100-']   # set default pulse shape, trigger setter function
         self._neg_pulse_length = 100
         self._pos_pulse_delay = 10
         self._pos_pulse_length = 20
+        # state and commands of the outputs; never held during uploads, so that switching off never waits for them
+        self._output_lock = threading.RLock()
+        self._output_off_requests = 0   # number of requests to switch the output off, see frequency setter
+        self._binary_upload = True  # upload waveforms as binary DAC block, ASCII is used if not supported
+        self._binary_upload_verified = False    # binary upload is checked in the error queue only once
+        self._upload_times = [0.0, 0.0]     # duration of the last waveform upload of channel 1 and 2 in seconds
+        self._completion_timeout = 5.0  # max. time in seconds to wait for the instrument to finish an operation
+        self._completion_time = 0.0     # duration of the last wait for completion in seconds
+        # configuration last sent to the instrument, only changed command groups are sent again
+        self._instrument_state = {}
+        self.__invalidate_instrument_state()
         # self._inst = None
 
     @property  # connected
     def connected(self):  # get connected status
         return self._connected
 
+    @exclusive
     def initialization(self):
         # rm = pyvisa.ResourceManager('@py')
         # connect to a specific instrument
@@ -42,54 +68,122 @@ class RigolDG4102Pulser(Instrument):
         self._inst.write(":OUTPut1:IMPedance 50")
         self._inst.write(":OUTPut2 OFF")  # turn OFF the channel 2
         self._inst.write(":OUTPut2:IMPedance 50")
+        self.__invalidate_instrument_state()    # instrument was set to default values
+        self.__reset_binary_upload()
         self.__cmd_frequency()  # set frequency and amplitude for both channels
         self._inst.write(":SOURce1:TRACE:DATA:POINts:INTerpolate OFF")  # unset the linear interpolation of the points
         self._inst.write(":SOURce2:TRACE:DATA:POINts:INTerpolate OFF")  # unset the linear interpolation of the points
-        # set negative pulse
-        self.__cmd_pulse_shape(1)
-        self.__cmd_negative_pulse_modulation()
-        # set positive pulse
-        self.__cmd_pulse_shape(2)
-        self.__cmd_positive_pulse_synchronization()
+        # set negative pulse and positive pulse
+        self.__sync_instrument(ch2=True)
         self._output = False
         self._connected = True  # set connected to True if not exception has been risen so far
 
+    # after a reconnect: the generator may have been reset, the whole configuration and the outputs are sent again
+    def restore_configuration(self):
+        self._inst.write(":OUTPut1:IMPedance 50")
+        self._inst.write(":OUTPut2:IMPedance 50")
+        self._inst.write(":SOURce1:TRACE:DATA:POINts:INTerpolate OFF")
+        self._inst.write(":SOURce2:TRACE:DATA:POINts:INTerpolate OFF")
+        self.__invalidate_instrument_state()
+        self.__reset_binary_upload()
+        self.__sync_instrument()
+        self.__wait_for_completion()
+        with self._output_lock:
+            self._inst.write(':OUTPut1 ' + ('ON' if self._output else 'OFF'))
+            self._inst.write(':OUTPut2 ' + ('ON' if self._output and self._ch2_enabled else 'OFF'))
+
+    # binary upload is tried again and checked with the next upload (the instrument may have been replaced)
+    def __reset_binary_upload(self):
+        self._binary_upload = True
+        self._binary_upload_verified = False
+
+    @exclusive
     def disconnect(self):
         if self._output:
             self.output = False  # stop pulsing
         self._inst.close()
         self._connected = False
 
+    @property
+    def binary_upload(self):
+        return self._binary_upload
+
+    @property
+    def upload_times(self):
+        return self._upload_times
+
+    @property
+    def completion_time(self):
+        return self._completion_time
+
+    @property
+    def waveform_cache(self):
+        return self._waveform_cache
+
+    # parse and encode given pulse shapes (e.g. presets) for the actual frequency in a background thread
+    def precompute_waveforms(self, shapes):
+        frequency = self._frequency
+        threading.Thread(target=self.__precompute_waveforms, args=(shapes, frequency), daemon=True).start()
+
+    def __precompute_waveforms(self, shapes, frequency):
+        for shape in shapes:
+            try:
+                self.__get_waveforms(shape, frequency)
+            except ValueError:  # invalid shape is reported when it is really used
+                pass
+
     @property  # output
     def output(self):  # get output
         return self._output
 
+    # switching off is a safety command: it does not wait for a running operation (e.g. an upload of a frequency
+    # or shape change) and goes ahead of queued uploads
     @output.setter
     def output(self, value):  # set output
-        if not self._connected:
-            self._output = False
-        elif value != self._output:  # if different from actual value
-            self._output = value
-            str_value = 'ON' if value else 'OFF'
-            if self._ch2_enabled:  # set both channels
-                self._inst.write(':OUTPut1 ' + str_value)
-                self._inst.write(':OUTPut2 ' + str_value)
-            else:  # set only channel 1
-                self._inst.write(':OUTPut1 ' + str_value)
+        if value:
+            self.__output_on()
+        else:
+            self.__output_off()
+
+    @exclusive
+    @reconnecting
+    def __output_on(self):
+        with self._output_lock:
+            if not self._connected:
+                self._output = False
+            elif not self._output:  # if different from actual value
+                self._output = True
+                self._inst.write(':OUTPut1 ON')
+                if self._ch2_enabled:
+                    self._inst.write(':OUTPut2 ON')
+
+    @reconnecting
+    def __output_off(self):
+        with self._output_lock:
+            self._output_off_requests += 1
+            if not self._connected:
+                self._output = False
+            elif self._output:  # if different from actual value
+                self._output = False
+                self._inst.write(':OUTPut1 OFF', priority=InstrumentCommandQueue.SAFETY)
+                if self._ch2_enabled:
+                    self._inst.write(':OUTPut2 OFF', priority=InstrumentCommandQueue.SAFETY)
 
     @property  # ch2_enabled
     def ch2_enabled(self):
         return self._ch2_enabled
 
     @ch2_enabled.setter
+    @exclusive
+    @reconnecting
     def ch2_enabled(self, value):
         self._ch2_enabled = value
         if self._connected:
             if value:  # if channel 2 is being enabled
-                self.__cmd_pulse_shape(2)
-                self.__cmd_positive_pulse_synchronization()
-                if self._output:
-                    self._inst.write(':OUTPut2 ON')
+                self.__sync_instrument()    # positive pulse and its synchronization, only if changed
+                with self._output_lock:     # not switched on again if the output was switched off meanwhile
+                    if self._output:
+                        self._inst.write(':OUTPut2 ON')
             else:
                 self._inst.write(':OUTPut2 OFF')
 
@@ -97,95 +191,139 @@ class RigolDG4102Pulser(Instrument):
     def frequency(self):
         return self._frequency
 
-    @frequency.setter
-    def frequency(self, value):
+    @staticmethod
+    def __check_frequency(value):
         try:
             int_value = int(value)
         except ValueError:
             raise ValueError('Frequency input must be an integer')
         if int_value > 10000:
             raise ValueError('Frequency input must be lower than 10 kHz')
+        if int_value <= 0:
+            raise ValueError('Frequency input must be higher than 0 Hz')
+        return int_value
+
+    @frequency.setter
+    @exclusive
+    @reconnecting
+    def frequency(self, value):
+        int_value = self.__check_frequency(value)
         if int_value != self._frequency:  # do something only if frequency is changed
-            self._frequency = int_value
             # adapt pulse shape
-            self.__parse_pulse_shape(self._pulse_shape)   # use actual pulse shape to update waveforms based on
-            # new frequency
+            self.__parse_pulse_shape(self._pulse_shape, int_value)   # use actual pulse shape to update waveforms
+            # based on new frequency, nothing is changed if the shape is not valid for the new frequency
+            self._frequency = int_value
             if self._connected:
                 is_pulsing = self._output  # save if the pulser is active
                 if is_pulsing:
                     self.output = False  # turn of the output before frequency is changed
-                    time_module.sleep(0.1)
-                self.__cmd_frequency()  # update frequency in instrument
-                time_module.sleep(0.1)
-                self.__cmd_pulse_shape(1)  # update pulse shape which depends on frequency
-                self.__cmd_negative_pulse_modulation()  # needs to be started again with every change of the pulse shape
-                if self._ch2_enabled:  # update pulse shape for positive pulse if active
-                    self.__cmd_pulse_shape(2)
-                    self.__cmd_positive_pulse_synchronization()  # likely needs to be started again as well
-                time_module.sleep(0.1)
-                if is_pulsing:
-                    self.output = True  # turn output on again
+                    self.__wait_for_completion()
+                off_requests = self._output_off_requests
+                # update frequency and the pulse shapes which depend on frequency (only if they changed)
+                self.__sync_instrument()
+                self.__wait_for_completion()
+                with self._output_lock:     # not if the user switched the output off meanwhile
+                    if is_pulsing and self._output_off_requests == off_requests:
+                        self.output = True  # turn output on again
 
     @property
     def pulse_shape(self):
         return self._pulse_shape
 
-    # parse pulse shape string, check validity, depends on actual frequency
-    # updates channel 1 and 2 waveforms
-    def __parse_pulse_shape(self, shape):
-        # check pulse shape string validity
-        dt = 1e6 / (self._frequency * self._num_wf_points)
-        time_step = [0]  # time in dt steps
-        polarity = [0]
-        for s in shape:
-            if s[-1] == '-':  # negative pulse
-                polarity.append(-1)
+    # parse pulse shape string, check validity, depends on frequency (actual one if not given)
+    # channel 1 and 2 waveforms and their encodings are replaced only if the shape is valid
+    def __parse_pulse_shape(self, shape, frequency=None):
+        entry = self.__get_waveforms(shape, self._frequency if frequency is None else frequency)
+        self._ch1_waveform = entry.ch1_waveform
+        self._ch2_waveform = entry.ch2_waveform
+        self._ch1_encoded = entry.ch1_encoded
+        self._ch2_encoded = entry.ch2_encoded
+
+    # waveforms for the given shape and frequency, taken from the cache if possible
+    def __get_waveforms(self, shape, frequency):
+        shape = self.normalize_pulse_shape(shape)   # the same tokens for the key and for the compilation
+        key = WaveformCache.key(shape, frequency, self._num_wf_points)
+        entry = self._waveform_cache.get(key)
+        if entry is None:
+            ch1_waveform, ch2_waveform = self.__compute_waveforms(shape, frequency)
+            entry = WaveformEntry(ch1_waveform, ch2_waveform, self.__encode_dac(ch1_waveform),
+                                  self.__encode_dac(ch2_waveform))
+            self._waveform_cache.put(key, entry)
+        return entry
+
+    # check pulse shape validity without any change of the pulser (can be used for checking of user input)
+    # returns the compiled pulse shape
+    def validate(self, shape, frequency):
+        return self.compile_pulse_shape(shape, self.__check_frequency(frequency))
+
+    # pulse shape strings without surrounding whitespace (e.g. [' 30-', '20 '] -> ['30-', '20'])
+    @staticmethod
+    def normalize_pulse_shape(shape):
+        return [s.strip() for s in shape]
+
+    # compile pulse shape strings (e.g. ['30-', '20', '50+']) for the given frequency into segment lengths
+    # in waveform steps and polarities (-1 = negative pulse, 0 = delay, 1 = positive pulse)
+    def compile_pulse_shape(self, shape, frequency):
+        shape = self.normalize_pulse_shape(shape)
+        dt = 1e6 / (frequency * self._num_wf_points)
+        values = np.zeros(len(shape))
+        polarities = np.zeros(len(shape), dtype=int)
+        for i, s in enumerate(shape):
+            if s[-1:] == '-':  # negative pulse
+                polarities[i] = -1
                 s1 = s[:-1]
-            elif s[-1] == '+':  # positive pulse
-                polarity.append(1)
+            elif s[-1:] == '+':  # positive pulse
+                polarities[i] = 1
                 s1 = s[:-1]
             else:  # delay
-                polarity.append(0)
                 s1 = s
             try:
-                value = float(s1)
+                values[i] = float(s1)
             except ValueError:
                 raise ValueError('Invalid value of pulse length in ' + s)
-            if value < dt:
-                raise ValueError('Pulse length is shorter than minimal step (' + str(dt) +
-                                 ') determined by given frequency')
-            value_step = round(value / dt)  # divide by dt and round
-            if value_step * dt < 5.:  # if lower than 5 us (limit), try rounding up
-                value_step = ceil(value / dt)  # divide by dt and round
-            if value_step * dt < 5.:  # interval shorter than 5 us not allowed to ensure power supply is safe
-                raise ValueError('Pulse or delay length must be longer than 5 us')
-            time_step.append(time_step[-1] + value_step)
-        if time_step[-1] >= self._num_wf_points:
+        if np.any(values < dt):
+            raise ValueError('Pulse length is shorter than minimal step (' + str(dt) +
+                             ') determined by given frequency')
+        steps = np.round(values / dt).astype(int)  # divide by dt and round
+        short = steps * dt < 5.  # if lower than 5 us (limit), try rounding up
+        steps[short] = np.ceil(values[short] / dt)
+        if np.any(steps * dt < 5.):  # interval shorter than 5 us not allowed to ensure power supply is safe
+            raise ValueError('Pulse or delay length must be longer than 5 us')
+        if steps.sum() >= self._num_wf_points:
             raise ValueError('Total pulse length must shorter than pulse period')
-        # set channel waveforms
-        self._ch1_waveform.fill(0)  # set all zeros
-        self._ch2_waveform.fill(0)
-        for i in range(1, len(time_step)):  # go through prepared list of intervals, from 2nd to last
-            if polarity[i] == -1:
-                self._ch1_waveform[time_step[i - 1]:time_step[i]] = 1
-            elif polarity[i] == 1:
-                self._ch2_waveform[time_step[i - 1]:time_step[i]] = 1
+        return CompiledPulseShape(tuple(steps.tolist()), tuple(polarities.tolist()))
+
+    # create new channel waveforms from the compiled pulse shape
+    def __compute_waveforms(self, shape, frequency):
+        compiled = self.compile_pulse_shape(shape, frequency)
+        # segments followed by zeros until the end of the period
+        lengths = np.append(compiled.lengths, self._num_wf_points - sum(compiled.lengths))
+        polarities = np.append(compiled.polarities, 0)
+        ch1_waveform = np.repeat((polarities == -1).astype(int), lengths)
+        ch2_waveform = np.repeat((polarities == 1).astype(int), lengths)
+        return ch1_waveform, ch2_waveform
+
+    # waveform as 14-bit DAC values (0 = -1, 8192 = 0, 16383 = +1), unsigned 16-bit little endian
+    @staticmethod
+    def __encode_dac(waveform):
+        return (8192 + 8191 * waveform).astype('<u2').tobytes()
 
     @pulse_shape.setter
+    @exclusive
+    @reconnecting
     def pulse_shape(self, shape):
+        shape = self.normalize_pulse_shape(shape)
         self.__parse_pulse_shape(shape)
         self._pulse_shape = shape    # update shape string
-        if self._connected:  # send commands to instrument
+        if self._connected and self.__instrument_state_changed():  # send commands to instrument
             if self._output and self._ch2_enabled:  # if pulsing and ch2 enabled
                 self.__cmd_channel_state(2, False)  # turn off channel 2 while changing negative pulse length
-                time_module.sleep(0.1)  # wait some time
-            self.__cmd_pulse_shape(1)
-            self.__cmd_negative_pulse_modulation()  # needs to be started again with every change of the pulse shape
-            self.__cmd_pulse_shape(2)
-            self.__cmd_positive_pulse_synchronization()
-            time_module.sleep(0.1)
-            if self._output and self._ch2_enabled:
-                self.__cmd_channel_state(2, True)  # turn channel 2 on again
+                self.__wait_for_completion()  # wait until channel 2 is off
+            self.__sync_instrument()    # channel 1 is left alone if only the positive pulse changed
+            self.__wait_for_completion()
+            with self._output_lock:     # not if the output was switched off meanwhile
+                if self._output and self._ch2_enabled:
+                    self.__cmd_channel_state(2, True)  # turn channel 2 on again
 
     def get_waveforms(self):
         dt = 1e6/(self._frequency*self._num_wf_points)
@@ -195,6 +333,47 @@ class RigolDG4102Pulser(Instrument):
     def get_period(self):
         return 1e6 / self._frequency
 
+    # wait until the instrument finished all pending commands (*OPC? returns 1), at most completion_timeout
+    def __wait_for_completion(self):
+        time_start = time_module.perf_counter()
+        try:
+            # the longer VISA timeout (ms) is applied and restored by the owner thread of the session
+            self._inst.query('*OPC?', timeout=self._completion_timeout * 1000)
+        except visa_io_error():
+            logger.warning('Pulser did not complete the operation within %.1f s', self._completion_timeout)
+        self._completion_time = time_module.perf_counter() - time_start
+        logger.info('Pulser operation completed in %.1f ms', self._completion_time * 1000)
+
+    # nothing is known about the instrument configuration, everything is sent with the next synchronization
+    def __invalidate_instrument_state(self):
+        self._instrument_state = {'frequency': None, 'ch1_trace': None, 'ch2_trace': None, 'modulation': False,
+                                  'burst': False}
+
+    # True if the actual configuration differs from the one last sent to the instrument
+    def __instrument_state_changed(self):
+        state = self._instrument_state
+        return (state['frequency'] != self._frequency or state['ch1_trace'] != self._ch1_encoded or
+                not state['modulation'] or
+                (self._ch2_enabled and (state['ch2_trace'] != self._ch2_encoded or not state['burst'])))
+
+    # send only the command groups whose configuration changed since they were sent last time
+    def __sync_instrument(self, ch2=None):
+        if ch2 is None:
+            ch2 = self._ch2_enabled     # positive pulse is sent only if channel 2 is used
+        state = self._instrument_state
+        if state['frequency'] != self._frequency:
+            self.__cmd_frequency()
+            self.__wait_for_completion()
+        if state['ch1_trace'] != self._ch1_encoded:
+            self.__cmd_pulse_shape(1)
+        if not state['modulation']:
+            self.__cmd_negative_pulse_modulation()  # needs to be started again with every change of the pulse shape
+        if ch2:
+            if state['ch2_trace'] != self._ch2_encoded:
+                self.__cmd_pulse_shape(2)
+            if not state['burst']:
+                self.__cmd_positive_pulse_synchronization()  # likely needs to be started again as well
+
     def __cmd_channel_state(self, channel, value):
         str_value = 'ON' if value else 'OFF'
         if self._ch2_enabled:  # set both channels
@@ -215,6 +394,8 @@ class RigolDG4102Pulser(Instrument):
         #                 ',' + str(2 * self._amplitude) + ',0,0')  # channel 2, increase by 1 percent, see coefficient
         self._inst.write(':SOURce2:APPLy:CUSTom ' + freq2_str +
                          ',' + str(2 * self._amplitude) + ',0,0')  # channel 2, increase by 1 percent, see coefficient
+        # APPLy turns modulation and burst off, they must be set again
+        self._instrument_state.update(frequency=self._frequency, modulation=False, burst=False)
 
     # send commands to enable negative pulse modulation for arc detection
     def __cmd_negative_pulse_modulation(self):
@@ -223,6 +404,7 @@ class RigolDG4102Pulser(Instrument):
         self._inst.write(":SOURce1:MOD:ASKey:POLarity POSitive")  # set the polarity for the modulation
         self._inst.write(":SOURce1:MOD:ASKey:SOURce EXTernal")  # use the external input for the modulation
         self._inst.write(":SOURce1:MOD:ASKey:AMPLitude 0")  # set the coefficient for the modulation
+        self._instrument_state['modulation'] = True
 
     # send commands to set triggering of positive pulse
     def __cmd_positive_pulse_synchronization(self):
@@ -237,14 +419,42 @@ class RigolDG4102Pulser(Instrument):
         self._inst.write(":SOURce2:BURSt:TRIGger:SLOP POS")  # start the trigger when falling signal
         # (end of the positive pulse)
         # self.inst.write(":SOURce2:BURSt:INTernal:PERiod 0.0001")
+        self._instrument_state['burst'] = True
 
     # send command describing the shape of the pulse for the given channel
     def __cmd_pulse_shape(self, channel):
         if channel == 1:
-            wf_str = ", ".join(map(str, self._ch1_waveform))  # convert "pos_pulse_shape" to a string with values
-            # delimited by ","
+            waveform = self._ch1_waveform
+            encoded = self._ch1_encoded
         elif channel == 2:
-            wf_str = ", ".join(map(str, self._ch2_waveform))
+            waveform = self._ch2_waveform
+            encoded = self._ch2_encoded
         else:
             return
+        time_start = time_module.perf_counter()
+        if self._binary_upload:
+            if not self._binary_upload_verified:
+                self._inst.write('*CLS')    # older errors in the queue must not be taken for a rejected block
+            self.__cmd_pulse_shape_binary(channel, encoded)
+            if not self._binary_upload_verified:    # check once that the instrument accepted the binary block
+                self._binary_upload_verified = True
+                if not self._inst.query(':SYSTem:ERRor?').startswith('0'):
+                    self._binary_upload = False     # not supported, use ASCII from now on
+        if not self._binary_upload:
+            self.__cmd_pulse_shape_ascii(channel, waveform)
+        self._upload_times[channel - 1] = time_module.perf_counter() - time_start
+        if channel == 1:    # new trace of channel 1 requires new modulation setup
+            self._instrument_state.update(ch1_trace=encoded, modulation=False)
+        else:   # new trace of channel 2 requires new burst setup
+            self._instrument_state.update(ch2_trace=encoded, burst=False)
+
+    # encoded waveform (see __encode_dac) as IEEE 488.2 definite length block
+    def __cmd_pulse_shape_binary(self, channel, data):
+        length = str(len(data))
+        header = '#' + str(len(length)) + length
+        self._inst.write_raw((':SOURce' + str(channel) + ':TRACE:DATA:DAC VOLATILE,' + header).encode('ascii') + data)
+
+    # waveform as comma separated list of normalized values
+    def __cmd_pulse_shape_ascii(self, channel, waveform):
+        wf_str = ", ".join(map(str, waveform))  # convert waveform to a string with values delimited by ","
         self._inst.write(':SOURce'+str(channel)+':TRACE:DATA VOLATILE,' + wf_str)  # send shape data
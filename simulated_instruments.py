@@ -0,0 +1,259 @@
+import math
+import random
+import re
+import threading
+import time
+import pyvisa
+
+
+# end of the link outage (time.monotonic) of every resource id, see interrupt_link
+_link_lost_until = {}
+
+
+# simulated loss of the link to the instrument (e.g. USB cable pulled) for the given time in seconds: all transfers
+# of the open session fail and the resource cannot be opened again before the end of the outage
+def interrupt_link(resource_id, duration):
+    _link_lost_until[resource_id] = time.monotonic() + duration
+
+
+def link_lost(resource_id):
+    return time.monotonic() < _link_lost_until.get(resource_id, 0.0)
+
+
+# local stand-ins for the instruments, used by Instrument.connect for resource ids "SIM::<model>[::key=value...]",
+# e.g. "SIM::IT6726V::query_latency=0.005" or "SIM::DG4102"; they behave like a pyvisa message based resource
+# link_loss_rate (outages per second) and link_loss_duration (s) simulate an unreliable link
+class SimulatedResource(object):
+    def __init__(self, command_latency=0.001, query_latency=0.002, transfer_rate=1e6, timeout=1000,
+                 link_loss_rate=0.0, link_loss_duration=1.0, resource_name='SIM'):
+        self.command_latency = command_latency  # time of one write in seconds
+        self.query_latency = query_latency  # time of one query (write + read) in seconds
+        self.transfer_rate = transfer_rate  # bytes per second, adds to the latency of long transfers
+        self.timeout = timeout  # VISA timeout in ms
+        self.link_loss_rate = link_loss_rate
+        self.link_loss_duration = link_loss_duration
+        self.resource_name = resource_name
+        self._errors = []   # error queue (:SYSTem:ERRor?)
+        self._lock = threading.Lock()
+        self._closed = False
+        self._time_transfer = time.monotonic()
+
+    def __transfer(self, latency, size):
+        if self._closed:
+            raise pyvisa.errors.InvalidSession()
+        now = time.monotonic()
+        if random.random() < self.link_loss_rate * (now - self._time_transfer):
+            interrupt_link(self.resource_name, self.link_loss_duration)
+        self._time_transfer = now
+        if link_lost(self.resource_name):
+            raise pyvisa.errors.VisaIOError(pyvisa.constants.StatusCode.error_connection_lost)
+        time.sleep(latency + size / self.transfer_rate)
+
+    def write(self, command):
+        self.__transfer(self.command_latency, len(command))
+        with self._lock:
+            for part in self.__split(command):  # answers of queries sent by write are never read
+                self.handle_command(part)
+
+    def write_raw(self, data):
+        self.__transfer(self.command_latency, len(data))
+        with self._lock:
+            self.handle_raw(bytes(data))
+
+    def query(self, command):
+        self.__transfer(self.query_latency, len(command))
+        with self._lock:
+            answers = [self.handle_command(part) for part in self.__split(command)]
+        if any(answer is None for answer in answers):   # no answer -> timeout like the real instrument
+            time.sleep(self.timeout / 1000)
+            raise pyvisa.errors.VisaIOError(pyvisa.constants.StatusCode.error_timeout)
+        return ';'.join(answers) + '\n'
+
+    def close(self):
+        self._closed = True
+
+    @staticmethod
+    def __split(command):
+        # compound commands are separated by ';', a leading ':' starts from the root of the command tree
+        return [part.strip().lstrip(':') for part in command.strip().split(';') if part.strip()]
+
+    def add_error(self, message):
+        self._errors.append(message)
+
+    def handle_common_command(self, command):
+        # IEEE 488.2 common commands, returns (handled, answer)
+        upper = command.upper()
+        if upper == '*CLS':
+            self._errors.clear()
+            return True, None
+        if upper == '*OPC?':
+            return True, '1'
+        if upper.startswith('SYST') and upper.endswith(('ERR?', 'ERROR?')):
+            return True, self._errors.pop(0) if self._errors else '0,"No error"'
+        return False, None
+
+    def handle_command(self, command):
+        # returns the answer of a query or None; the simulated instruments add their own commands
+        handled, answer = self.handle_common_command(command)
+        if not handled:
+            self.add_error('-113,"Undefined header"')
+        return answer
+
+    def handle_raw(self, data):
+        self.add_error('-100,"Command error"')
+
+
+# ITECH IT6726V power supply with a magnetron-like load: no current below the ignition voltage,
+# I = k * (U - U_ignition) ** n above it; random arcs (voltage collapse, current at the limit) and noise
+class SimulatedIT6726V(SimulatedResource):
+    def __init__(self, ignition_voltage=280.0, current_coefficient=2e-7, current_exponent=3.0,
+                 current_limit=5.0, time_constant=0.02, noise=0.005, arc_rate=0.05, arc_duration=0.02,
+                 arc_voltage=40.0, compound_queries=True, **kwargs):
+        super().__init__(**kwargs)
+        self.ignition_voltage = ignition_voltage    # V
+        self.current_coefficient = current_coefficient  # A / V ** n
+        self.current_exponent = current_exponent
+        self.current_limit = current_limit  # A
+        self.time_constant = time_constant  # s, output voltage follows the setpoint with a first order lag
+        self.noise = noise  # relative noise of the measured values
+        self.arc_rate = arc_rate    # arcs per second
+        self.arc_duration = arc_duration    # s
+        self.arc_voltage = arc_voltage  # V, burning voltage of an arc
+        self.compound_queries = compound_queries    # accept several queries separated by ';'
+        self._output = False
+        self._voltage_setpoint = 0.0
+        self._voltage = 0.0     # actual output voltage
+        self._time = time.monotonic()
+        self._arc_end = 0.0
+
+    def __update(self):
+        # advance the model to the actual time
+        now = time.monotonic()
+        dt = now - self._time
+        self._time = now
+        target = self._voltage_setpoint if self._output else 0.0
+        self._voltage = target + (self._voltage - target) * math.exp(-dt / self.time_constant)
+        if self._output and self._voltage > self.ignition_voltage and self._arc_end < now and \
+                random.random() < 1 - math.exp(-self.arc_rate * dt):
+            self._arc_end = now + self.arc_duration
+
+    def __measure(self):
+        self.__update()
+        if self._arc_end > self._time:  # arc, the supply runs into its current limit
+            voltage, current = self.arc_voltage, self.current_limit
+        else:
+            voltage = self._voltage
+            current = self.current_coefficient * max(voltage - self.ignition_voltage, 0.0) ** self.current_exponent
+            if current > self.current_limit:
+                current = self.current_limit
+                voltage = self.ignition_voltage + (current / self.current_coefficient) ** (1 / self.current_exponent)
+        voltage *= 1 + random.gauss(0, self.noise)
+        current *= 1 + random.gauss(0, self.noise)
+        return voltage, voltage * current, current
+
+    def handle_command(self, command):
+        handled, answer = self.handle_common_command(command)
+        if handled:
+            return answer
+        upper = command.upper()
+        if upper == '*RST':
+            self._output = False
+            self._voltage_setpoint = 0.0
+        elif upper == '*IDN?':
+            return 'ITECH Ltd.,IT6726V,SIMULATED,1.0'
+        elif upper.startswith('VOLT ') or upper.startswith('VOLTAGE '):
+            self.__update()
+            try:
+                self._voltage_setpoint = float(command.split()[1])
+            except (IndexError, ValueError):
+                self.add_error('-224,"Illegal parameter value"')
+        elif upper.startswith('OUTP'):
+            self.__update()
+            self._output = upper.split()[-1] in ('ON', '1')
+        elif upper.startswith('MEAS'):
+            voltage, power, current = self.__measure()
+            if 'VOLT' in upper:
+                return '{:.2f}'.format(voltage)
+            if 'POW' in upper:
+                return '{:.2f}'.format(power)
+            if 'CURR' in upper:
+                return '{:.5f}'.format(current)
+            self.add_error('-113,"Undefined header"')
+        else:
+            self.add_error('-113,"Undefined header"')
+        return None
+
+    def query(self, command):
+        if not self.compound_queries and ';' in command:    # firmware without compound queries
+            time.sleep(self.timeout / 1000)
+            self.add_error('-113,"Undefined header"')
+            raise pyvisa.errors.VisaIOError(pyvisa.constants.StatusCode.error_timeout)
+        return super().query(command)
+
+
+# Rigol DG4102 function generator; keeps the received configuration and channel traces
+class SimulatedDG4102(SimulatedResource):
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self.state = {}     # last received value of every configuration command
+        self.traces = {1: b'', 2: b''}  # channel traces (binary DAC data or ASCII values)
+        self.__preset()
+
+    def __preset(self):
+        self.state = {}
+        self.traces = {1: b'', 2: b''}
+
+    def handle_command(self, command):
+        handled, answer = self.handle_common_command(command)
+        if handled:
+            return answer
+        upper = command.upper()
+        if upper.startswith('SYST') and 'PRES' in upper:
+            self.__preset()
+            return None
+        if upper == '*IDN?':
+            return 'Rigol Technologies,DG4102,SIMULATED,1.0'
+        match = re.match(r'SOUR(?:CE)?([12]):TRAC(?:E)?:DATA (?:VOLATILE|VOL),(.*)', command, re.IGNORECASE)
+        if match:   # ASCII trace
+            self.traces[int(match.group(1))] = match.group(2).encode('ascii')
+            return None
+        match = re.match(r'(\S+)\s*(.*)', command)
+        header, value = match.group(1).upper(), match.group(2)
+        if header.endswith('?'):
+            return self.state.get(header[:-1], '0')
+        if not re.match(r'(OUTP|SOUR|DISP)', header):
+            self.add_error('-113,"Undefined header"')
+            return None
+        self.state[header] = value
+        return None
+
+    def handle_raw(self, data):
+        # binary trace as IEEE 488.2 definite length block
+        match = re.match(rb':?SOUR(?:CE)?([12]):TRAC(?:E)?:DATA:DAC (?:VOLATILE|VOL),#(\d)', data, re.IGNORECASE)
+        if not match:
+            self.add_error('-100,"Command error"')
+            return
+        digits = int(match.group(2))
+        length = int(data[match.end():match.end() + digits])
+        block = data[match.end() + digits:match.end() + digits + length]
+        if len(block) != length:
+            self.add_error('-104,"Data type error"')
+            return
+        self.traces[int(match.group(1))] = block
+
+
+# create the simulated resource for a resource id "SIM::<model>[::key=value...]"
+def open_simulated_resource(resource_id, timeout=1000):
+    parts = resource_id.split('::')
+    model = parts[1].upper() if len(parts) > 1 else ''
+    if link_lost(resource_id):
+        raise pyvisa.errors.VisaIOError(pyvisa.constants.StatusCode.error_resource_not_found)
+    kwargs = {'timeout': timeout, 'resource_name': resource_id}
+    for part in parts[2:]:
+        key, _, value = part.partition('=')
+        kwargs[key] = value.lower() == 'true' if value.lower() in ('true', 'false') else float(value)
+    if model == 'IT6726V':
+        return SimulatedIT6726V(**kwargs)
+    if model == 'DG4102':
+        return SimulatedDG4102(**kwargs)
+    raise ValueError('Unknown simulated instrument ' + model)
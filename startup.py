@@ -0,0 +1,33 @@
+import importlib
+import time
+
+
+# durations of the startup phases of the GUI (imports, config, widgets, first window, plots); every mark ends a
+# phase which started with the previous mark, reported by "main.pyw --startup-profile"
+class StartupTimer(object):
+    def __init__(self):
+        self._start = time.perf_counter()
+        self._last = self._start
+        self._phases = []   # (phase, duration in s, time since the start in s)
+
+    @property
+    def phases(self):
+        return self._phases
+
+    def mark(self, phase):
+        now = time.perf_counter()
+        self._phases.append((phase, now - self._last, now - self._start))
+        self._last = now
+
+    def report(self):
+        lines = ['{:<24s} {:>10s} {:>10s}'.format('phase', 'duration', 'total')]
+        for phase, duration, total in self._phases:
+            lines.append('{:<24s} {:7.1f} ms {:7.1f} ms'.format(phase, duration * 1000, total * 1000))
+        return '\n'.join(lines)
+
+
+# import modules which are not needed to show the window (matplotlib, pyvisa); run outside of the Tk main loop
+# so that the window is usable meanwhile
+def import_modules(names):
+    for name in names:
+        importlib.import_module(name)
@@ -0,0 +1,105 @@
+import time
+from multiprocessing import shared_memory
+import numpy as np
+
+
+# store of the PID loop telemetry; all values of one cycle are kept in one row
+# written by one thread (PID loop) only, read by any number of threads without locking (sequence lock)
+# the store can be placed in shared memory: the writer process creates it (create=True), reader processes attach
+# to it by its name and map the rows without copying
+class TelemetryStore(object):
+    # columns of a row
+    TIME = 0
+    VOLTAGE_CALC = 1
+    VOLTAGE_PS = 2
+    POWER_PS = 3
+    CURRENT_PS = 4
+    MODE = 5
+    NO_OF_FIELDS = 6
+    # header in front of the rows: sequence number (odd while the writer is changing the data) and position of
+    # the next write (the oldest row is stored there)
+    SEQUENCE = 0
+    HEAD = 1
+    HEADER_SIZE = 2
+
+    def __init__(self, size, shared_memory_name=None, create=False):
+        self._size = size
+        self._shared_memory = None
+        self._shared_memory_created = create
+        data_shape = (2 * self._size, self.NO_OF_FIELDS)
+        if shared_memory_name is None and not create:  # private memory of the process
+            self._header = np.zeros(self.HEADER_SIZE, dtype=np.int64)
+            # every row is stored twice (at i and i + size) so that the last "size" rows are one contiguous slice
+            self._data = np.zeros(data_shape)
+        else:
+            header_bytes = self.HEADER_SIZE * np.dtype(np.int64).itemsize
+            self._shared_memory = shared_memory.SharedMemory(
+                name=shared_memory_name, create=create,
+                size=header_bytes + int(np.prod(data_shape)) * np.dtype(np.float64).itemsize if create else 0)
+            self._header = np.ndarray(self.HEADER_SIZE, dtype=np.int64, buffer=self._shared_memory.buf)
+            self._data = np.ndarray(data_shape, dtype=np.float64, buffer=self._shared_memory.buf,
+                                    offset=header_bytes)
+            if create:
+                self._header.fill(0)
+                self._data.fill(0)
+
+    @property
+    def size(self):
+        return self._size
+
+    @property
+    def shared_memory_name(self):
+        # None if the store is not shared
+        return None if self._shared_memory is None else self._shared_memory.name
+
+    @property
+    def sequence(self):
+        # number increased with every change, can be used by readers to detect new data
+        return int(self._header[self.SEQUENCE])
+
+    def update(self, process_time, voltage_calc, voltage_ps, power_ps, current_ps, mode):
+        row = (process_time, voltage_calc, voltage_ps, power_ps, current_ps, mode)
+        header = self._header
+        head = int(header[self.HEAD])
+        header[self.SEQUENCE] += 1     # start of the write, readers will retry
+        self._data[head] = row
+        self._data[head + self._size] = row
+        header[self.HEAD] = (head + 1) % self._size
+        header[self.SEQUENCE] += 1     # end of the write
+
+    def clear(self):
+        self._header[self.SEQUENCE] += 1
+        self._data.fill(0)
+        self._header[self.HEAD] = 0
+        self._header[self.SEQUENCE] += 1
+
+    def snapshot(self):
+        # consistent copy of all rows (oldest ... newest); the writer is never blocked, the reader retries instead
+        while True:
+            sequence = int(self._header[self.SEQUENCE])
+            if not sequence & 1:
+                head = int(self._header[self.HEAD])
+                rows = self._data[head:head + self._size].copy()
+                if sequence == self._header[self.SEQUENCE]:
+                    return rows
+            time.sleep(0)   # let the writer finish
+
+    def latest(self):
+        # consistent copy of the newest row
+        while True:
+            sequence = int(self._header[self.SEQUENCE])
+            if not sequence & 1:
+                row = self._data[int(self._header[self.HEAD]) + self._size - 1].copy()
+                if sequence == self._header[self.SEQUENCE]:
+                    return row
+            time.sleep(0)
+
+    def close(self):
+        # release the shared memory; the creator removes it
+        if self._shared_memory is not None:
+            self._header = np.zeros(self.HEADER_SIZE, dtype=np.int64)  # the views must not outlive the mapping
+            self._data = np.zeros((2 * self._size, self.NO_OF_FIELDS))
+            self._shared_memory.close()
+            if self._shared_memory_created:
+                self._shared_memory.unlink()
+            self._shared_memory = None
@@ -0,0 +1,151 @@
+import logging
+import os
+import queue
+import threading
+import time
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+
+# background recorder of the PID loop telemetry
+# every run is stored in two files:
+#   <name>.bin - rows of float64 values (see FIELDS), appended in chunks, can be memory mapped
+#   <name>.idx - one float64 row per chunk: (time of first row, time of last row, index of first row, number of rows)
+class TelemetryRecorder(object):
+    FIELDS = ('time', 'voltage_calc', 'voltage_ps', 'power_ps', 'current_ps', 'mode',
+              'setpoint_voltage', 'setpoint_power', 'setpoint_current')
+    INDEX_FIELDS = 4
+
+    def __init__(self, directory, chunk_rows=1024, queue_size=10000, flush_interval=1.0, stop_timeout=2.0):
+        self._directory = directory
+        self._chunk_rows = chunk_rows   # max. number of rows written at once
+        self._flush_interval = flush_interval   # max. time in seconds before an incomplete chunk is written
+        self._stop_timeout = stop_timeout   # max. time in seconds stop() waits for the writer thread
+        self._queue_size = queue_size
+        self._queue = queue.Queue(maxsize=queue_size)   # bounded queue between the PID loop and the writer thread
+        self._thread = None
+        self._path = None
+        self._dropped_rows = 0  # rows lost because the queue was full (disk too slow)
+        self._written_rows = 0
+
+    @property
+    def path(self):
+        # path of the actual (or last) recording without extension
+        return self._path
+
+    @property
+    def dropped_rows(self):
+        return self._dropped_rows
+
+    @property
+    def written_rows(self):
+        return self._written_rows
+
+    @property
+    def recording(self):
+        return self._thread is not None
+
+    def start(self, name):
+        if self._thread is not None:
+            self.stop()
+        try:
+            os.makedirs(self._directory, exist_ok=True)
+        except OSError as exc:  # the run is not recorded, the PID loop keeps running
+            logger.error('Recording to %s not started: %s', self._directory, exc)
+            return
+        self._path = self.__new_path(name + '_' + time.strftime('%Y%m%d_%H%M%S'))
+        self._dropped_rows = 0
+        self._written_rows = 0
+        self._queue = queue.Queue(maxsize=self._queue_size)     # nothing of a writer which did not stop is taken over
+        self._thread = threading.Thread(target=self.__write_loop, args=(self._path, self._queue), daemon=True)
+        self._thread.start()
+
+    def __new_path(self, name):
+        # runs started within the same second get a numbered suffix, a recording is never appended to
+        path = os.path.join(self._directory, name)
+        number = 1
+        while os.path.exists(path + '.bin') or os.path.exists(path + '.idx'):
+            number += 1
+            path = os.path.join(self._directory, '{}_{}'.format(name, number))
+        return path
+
+    def stop(self):
+        # called from the PID loop, waits at most stop_timeout (a writer thread stopped by an error is not waited for)
+        if self._thread is None:
+            return
+        if self._thread.is_alive():
+            try:
+                self._queue.put(None, timeout=self._stop_timeout)   # end mark, waits only if the queue is full
+            except queue.Full:
+                pass
+            self._thread.join(self._stop_timeout)
+            if self._thread.is_alive():
+                logger.error('Recording %s: writer did not finish within %.1f s, rest of the rows is lost',
+                             self._path, self._stop_timeout)
+        self._thread = None
+
+    def record(self, *row):
+        # called from the PID loop, never waits on the disk
+        if self._thread is None:
+            return
+        try:
+            self._queue.put_nowait(row)
+        except queue.Full:
+            self._dropped_rows += 1
+
+    def __write_loop(self, path, rows_queue):
+        try:
+            self.__write_rows(path, rows_queue)
+        except OSError as exc:  # disk full, no permission, ...; the PID loop keeps running, further rows are dropped
+            logger.error('Recording %s stopped: %s', path, exc)
+
+    def __write_rows(self, path, rows_queue):
+        rows = []
+        first_row = 0
+        with open(path + '.bin', 'xb') as data_file, open(path + '.idx', 'xb') as index_file:
+            running = True
+            while running:
+                try:
+                    row = rows_queue.get(timeout=self._flush_interval)
+                except queue.Empty:
+                    row = ()    # nothing new, write the incomplete chunk
+                if row is None:
+                    running = False
+                elif row:
+                    rows.append(row)
+                if rows and (len(rows) >= self._chunk_rows or not row):
+                    chunk = np.array(rows, dtype=np.float64)
+                    data_file.write(chunk.tobytes())
+                    data_file.flush()
+                    index = np.array([chunk[0, 0], chunk[-1, 0], first_row, len(rows)], dtype=np.float64)
+                    index_file.write(index.tobytes())   # index is written after the data it points to
+                    index_file.flush()
+                    first_row += len(rows)
+                    self._written_rows = first_row
+                    rows = []
+
+
+# read access to a recording made by TelemetryRecorder
+class TelemetryRecording(object):
+    def __init__(self, path):
+        self._path = path
+
+    def index(self):
+        index = np.fromfile(self._path + '.idx', dtype=np.float64)
+        return index.reshape(-1, TelemetryRecorder.INDEX_FIELDS)
+
+    def read_time_range(self, time_from, time_to):
+        # rows with time_from <= time <= time_to; only the chunks overlapping the range are loaded
+        index = self.index()
+        if len(index) == 0:
+            return np.zeros((0, len(TelemetryRecorder.FIELDS)))
+        selected = index[(index[:, 1] >= time_from) & (index[:, 0] <= time_to)]
+        if len(selected) == 0:
+            return np.zeros((0, len(TelemetryRecorder.FIELDS)))
+        first_row = int(selected[0, 2])
+        last_row = int(selected[-1, 2] + selected[-1, 3])
+        data = np.memmap(self._path + '.bin', dtype=np.float64, mode='r')
+        data = data[:last_row * len(TelemetryRecorder.FIELDS)].reshape(-1, len(TelemetryRecorder.FIELDS))
+        rows = data[first_row:last_row]
+        return np.array(rows[(rows[:, 0] >= time_from) & (rows[:, 0] <= time_to)])
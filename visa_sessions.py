@@ -0,0 +1,100 @@
+import functools
+import threading
+from async_transport import AsyncTransport
+
+
+# process-wide VISA resource manager and the open sessions of all instruments; one session per resource id and its
+# AsyncTransport (one owner thread doing all transfers) are shared by all users (reference counted), the session is
+# replaced by reopen() when the link to the instrument is lost
+class VisaSessionPool(object):
+    _instance = None
+    _instance_lock = threading.Lock()
+
+    def __init__(self, timeout=1000):
+        self._timeout = timeout     # VISA timeout of new sessions in ms
+        self._lock = threading.Lock()
+        self._resource_manager = None
+        self._sessions = {}     # resource id -> [transport, number of users, closed lost session]
+
+    @classmethod
+    def instance(cls):
+        with cls._instance_lock:
+            if cls._instance is None:
+                cls._instance = VisaSessionPool()
+            return cls._instance
+
+    @property
+    def resource_manager(self):
+        with self._lock:
+            return self.__resource_manager()
+
+    def __resource_manager(self):
+        # created with the first connection to a real (not simulated) instrument
+        if self._resource_manager is None:
+            import pyvisa
+            self._resource_manager = pyvisa.ResourceManager('@py')    # Linux version
+            # self._resource_manager = pyvisa.ResourceManager('')
+        return self._resource_manager
+
+    def __open_session(self, resource_id):
+        if resource_id.startswith('SIM::'):    # simulated instrument, e.g. "SIM::IT6726V"
+            from simulated_instruments import open_simulated_resource
+            return open_simulated_resource(resource_id, timeout=self._timeout)
+        import pyvisa
+        return self.__resource_manager().open_resource(resource_id, timeout=self._timeout,
+                                                       resource_pyclass=pyvisa.resources.USBInstrument)
+
+    def open(self, resource_id, name='instrument'):
+        # transport of the resource, the session is opened only if it is not used yet; the transport is given back
+        # by its close()
+        with self._lock:
+            entry = self._sessions.get(resource_id)
+            if entry is None:
+                transport = AsyncTransport(self.__open_session(resource_id), name,
+                                           release=functools.partial(self.release, resource_id))
+                entry = self._sessions[resource_id] = [transport, 0, None]
+            entry[1] += 1
+            return entry[0]
+
+    def reopen(self, resource_id, lost_session):
+        # new session instead of the lost one in the shared transport; nothing is done if another user has already
+        # replaced it; raises the error of the open (the instrument is still not reachable)
+        # returns None if the resource was released by all its users (the instrument is disconnected)
+        with self._lock:
+            entry = self._sessions.get(resource_id)
+            if entry is None:
+                return None
+            transport = entry[0]
+            if transport.resource is lost_session and entry[2] is not lost_session:
+                # closed by the owner thread; until a new session is open the transfers fail on the closed one
+                transport.commands.submit(transport.commands.SAFETY, self.__close_session, lost_session).result()
+                entry[2] = lost_session
+            if transport.resource is entry[2]:  # also after a failed reopen
+                transport.replace_resource(self.__open_session(resource_id))
+            return transport
+
+    def release(self, resource_id):
+        # the transport and its session are closed when the last user releases them
+        with self._lock:
+            entry = self._sessions.get(resource_id)
+            if entry is None:
+                return
+            entry[1] -= 1
+            if entry[1] > 0:
+                return
+            del self._sessions[resource_id]
+        entry[0].shutdown()
+
+    @staticmethod
+    def __close_session(session):
+        if session is None:
+            return
+        try:
+            session.close()
+        except Exception:   # the session may be lost already
+            pass
+
+    def sessions(self):
+        # number of users of every open session
+        with self._lock:
+            return {resource_id: entry[1] for resource_id, entry in self._sessions.items()}
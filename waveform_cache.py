@@ -0,0 +1,74 @@
+import collections
+import threading
+
+
+# waveforms of both channels for one (pulse shape, frequency, number of points) with upload-ready encodings
+class WaveformEntry(object):
+    def __init__(self, ch1_waveform, ch2_waveform, ch1_encoded, ch2_encoded):
+        ch1_waveform.flags.writeable = False    # arrays are shared between the cache and the pulser
+        ch2_waveform.flags.writeable = False
+        self.ch1_waveform = ch1_waveform
+        self.ch2_waveform = ch2_waveform
+        self.ch1_encoded = ch1_encoded
+        self.ch2_encoded = ch2_encoded
+
+    @property
+    def size(self):
+        # memory used by the entry in bytes
+        return (self.ch1_waveform.nbytes + self.ch2_waveform.nbytes +
+                len(self.ch1_encoded) + len(self.ch2_encoded))
+
+
+# least recently used cache of waveform entries with a limit of used memory, safe to use from several threads
+class WaveformCache(object):
+    def __init__(self, max_size):
+        self._max_size = max_size   # max. memory of all entries in bytes
+        self._size = 0
+        self._entries = collections.OrderedDict()
+        self._lock = threading.Lock()
+        self._hits = 0
+        self._misses = 0
+
+    @staticmethod
+    def key(shape, frequency, num_points):
+        # shape is expected normalized (see RigolDG4102Pulser.normalize_pulse_shape)
+        return tuple(shape), int(frequency), int(num_points)
+
+    @property
+    def hits(self):
+        return self._hits
+
+    @property
+    def misses(self):
+        return self._misses
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __contains__(self, key):
+        with self._lock:
+            return key in self._entries
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self._misses += 1
+            else:
+                self._hits += 1
+                self._entries.move_to_end(key)  # most recently used
+            return entry
+
+    def put(self, key, entry):
+        with self._lock:
+            if key in self._entries:
+                self._size -= self._entries.pop(key).size
+            self._entries[key] = entry
+            self._size += entry.size
+            while self._size > self._max_size and len(self._entries) > 1:   # evict the least recently used
+                self._size -= self._entries.popitem(last=False)[1].size
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._size = 0